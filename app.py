@@ -9,7 +9,14 @@ from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER
 import tkinter.messagebox as messagebox
 import tkinter.filedialog as filedialog
-from datetime import datetime
+from datetime import date, datetime
+
+from esporta import esporta
+from grafici import VISTE, GraficoCanvas, calcola_serie, disegno_pdf
+from imposte import TIPI, VENDITORI, aliquota_iva_agenzia, aliquota_sostitutiva
+from motore import calcola_righe, prodotto_incrociato
+from riepilogo import MODELLO, fmt_eur, titolo
+from risultati import RisultatiScenari
 
 # ── Palette colori scenario ────────────────────────────────────────────────────
 SCENARIO_COLORS = [
@@ -29,75 +36,55 @@ def to_float(value: str) -> float:
         return 0.0
 
 
-def fmt_eur(value: float) -> str:
-    return f"€ {value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-
-
-def _pol_breakdown(imp: float, mode: str, n_mesi: float):
-    """Restituisce (mensile, annuale, tot_durata, unica)."""
-    if mode == "In rata":
-        return imp, 0.0, imp * n_mesi, 0.0
-    elif mode == "Annuale":
-        return imp / 12, imp, imp / 12 * n_mesi, 0.0
-    else:  # Unica soluzione
-        return 0.0, 0.0, imp, imp
-
-
-def _pol_line(imp: float, mode: str, mensile: float) -> str:
-    if imp == 0:
-        return "non inserita"
-    if mode == "In rata":
-        return f"{fmt_eur(imp)}/mese (in rata)"
-    elif mode == "Annuale":
-        return f"{fmt_eur(imp)}/anno  (≈ {fmt_eur(mensile)}/mese)"
-    else:
-        return f"{fmt_eur(imp)} unica soluzione"
-
-
-def calcola_taeg(
-    importo: float,
-    upfront_costs: float,
-    rata_base: float,
-    n: int,
-    pol_si_imp: float,
-    pol_si_mode: str,
-) -> float | None:
-    """
-    TAEG (EU Mortgage Credit Directive).
-    Risolve: (importo - upfront_costs) = Σ CF_k / (1+r)^k  per r mensile.
-    Ritorna il tasso annuale effettivo globale in percentuale, o None se non calcolabile.
-    Inclusi nei CF: rata_base + pol. scoppio/incendio (obbligatoria).
-    Upfront: istruttoria + perizia + imp. sostitutiva + pol. unica scoppio/incendio.
-    """
-    net = importo - upfront_costs
-    if net <= 0 or n <= 0 or rata_base <= 0:
-        return None
-
-    cfs = []
-    for k in range(1, int(n) + 1):
-        cf = rata_base
-        if pol_si_mode == "In rata":
-            cf += pol_si_imp
-        elif pol_si_mode == "Annuale" and k % 12 == 0:
-            cf += pol_si_imp
-        cfs.append(cf)
-
-    def npv(mr: float) -> float:
-        return sum(c / (1 + mr) ** k for k, c in enumerate(cfs, 1)) - net
-
+def to_date(value: str) -> date:
+    """Data in formato gg/mm/aaaa; oggi se vuota, ValueError se non valida."""
+    value = (value or "").strip()
+    if not value:
+        return date.today()
     try:
-        lo, hi = 1e-9, 0.5
-        if npv(lo) * npv(hi) > 0:
-            return None
-        for _ in range(120):
-            mid = (lo + hi) / 2
-            if npv(mid) > 0:
-                lo = mid
-            else:
-                hi = mid
-        return ((1 + (lo + hi) / 2) ** 12 - 1) * 100
-    except Exception:
-        return None
+        return datetime.strptime(value, "%d/%m/%Y").date()
+    except ValueError:
+        raise ValueError(f"Data del rogito non valida: {value!r} "
+                         "(formato gg/mm/aaaa)") from None
+
+
+def _nota_sostitutiva(tipo: str) -> str:
+    pct = float(aliquota_sostitutiva(tipo)) * 100
+    return f"{pct:g}".replace(".", ",") + "% mutuo"
+
+
+def _righe_portafoglio(p: RisultatiScenari, m: int) -> list[str]:
+    """Matrice di confronto immobili × scenari (M per immobile) per il riepilogo."""
+    n        = len(p) // m
+    immobili = p[::m]["immobile"].tolist()
+    scenari  = p[:m]["label"].tolist()
+    costo    = p["costo_totale"].reshape(n, m)
+    rata     = p["rata"].reshape(n, m)
+    w0 = min(max(len(s) for s in immobili), 22)
+    w  = max(14, min(max(len(s) for s in scenari), 18))
+
+    def riga(nome: str, celle: list[str]) -> str:
+        return f"  {nome[:w0]:<{w0}}" + "".join(f"  {c[:w]:>{w}}" for c in celle)
+
+    lines = [
+        "═══════════════════════════════════════════════════",
+        "  CONFRONTO PORTAFOGLIO (immobili × scenari)",
+        "═══════════════════════════════════════════════════",
+    ]
+    for intestazione, mat in (("Costo totale", costo), ("Rata totale mensile", rata)):
+        lines += ["", f"── {intestazione} ──", riga("", scenari)]
+        lines += [riga(nome, [fmt_eur(v) for v in valori])
+                  for nome, valori in zip(immobili, mat)]
+
+    lines += ["", "── Scenario migliore per immobile (costo totale) ──"]
+    for nome, c, r in zip(immobili, costo, rata):
+        j = int(c.argmin())
+        lines.append(f"  {nome}: {scenari[j]} — {fmt_eur(c[j])}"
+                     f"  (rata {fmt_eur(r[j])})")
+    i, j = divmod(int(costo.argmin()), m)
+    lines.append(f"  ► MIGLIORE: {immobili[i]} + {scenari[j]}"
+                 f" — {fmt_eur(costo[i, j])}")
+    return lines
 
 
 # ── Widget helpers ─────────────────────────────────────────────────────────────
@@ -139,6 +126,7 @@ class MutuoWidget(ctk.CTkFrame):
 
     def _build(self):
         color = SCENARIO_COLORS[self._index % len(SCENARIO_COLORS)]
+        self.color = color
 
         # ── Intestazione scenario ──────────────────────────────────────────
         header = ctk.CTkFrame(self, fg_color=color, corner_radius=6)
@@ -235,7 +223,7 @@ class MutuoWidget(ctk.CTkFrame):
                                        placeholder_text="auto")
         self.e_imp_sost.grid(row=10, column=4, padx=(8, 0), pady=4, sticky="w")
         self._lbl_imp_sost_note = ctk.CTkLabel(
-            g, text="0,25% mutuo", anchor="w",
+            g, text=_nota_sostitutiva("Prima casa"), anchor="w",
             text_color=("gray50", "gray55"),
             font=ctk.CTkFont(size=11, slant="italic"),
         )
@@ -305,8 +293,7 @@ class MutuoWidget(ctk.CTkFrame):
             self._lbl_imp_sost_note.configure(text="")
         else:
             self.e_imp_sost.configure(state="disabled", placeholder_text="auto")
-            note = "0,25% mutuo" if value == "Prima casa" else "2% mutuo"
-            self._lbl_imp_sost_note.configure(text=note)
+            self._lbl_imp_sost_note.configure(text=_nota_sostitutiva(value))
 
     # ── Modalità importo ───────────────────────────────────────────────────
     def _on_mode_change(self, value: str):
@@ -324,92 +311,112 @@ class MutuoWidget(ctk.CTkFrame):
             imp = int(current / 100 * prezzo) if prezzo > 0 and current > 0 else 160000
             self.e_importo.insert(0, str(imp))
 
-    # ── Calcola scenario ───────────────────────────────────────────────────
-    def calcola(self, prezzo: float, notaio: float, agenzia: float,
-                imposta: float, agenzia_extra: dict | None = None) -> dict:
+    def get_label(self) -> str:
+        return self._entry_nome.get() or f"Scenario {self._index + 1}"
+
+    def parametri_mutuo(self, prezzo: float) -> tuple[float, float, float, float]:
+        """Restituisce (importo, % prezzo, tasso annuo come frazione, durata anni)."""
         raw     = to_float(self.e_importo.get())
         importo = prezzo * raw / 100 if self.mutuo_mode.get() == "% Prezzo" else raw
         pct     = raw if self.mutuo_mode.get() == "% Prezzo" else (
             raw / prezzo * 100 if prezzo else 0
         )
-        tasso_ann  = to_float(self.e_tasso.get()) / 100
-        durata_ann = to_float(self.e_durata.get())
-
-        r = tasso_ann / 12
-        n = durata_ann * 12
-        rata_base = importo * r / (1 - (1 + r) ** (-n)) if r > 0 and n > 0 else 0.0
-
-        pol_si_imp  = to_float(self.e_pol_si.get())
-        pol_v_imp   = to_float(self.e_pol_v.get())
-        pol_si_mode = self.pol_si_mode.get()
-        pol_v_mode  = self.pol_v_mode.get()
-
-        pol_si_mens, _, pol_si_tot, pol_si_unica = _pol_breakdown(pol_si_imp, pol_si_mode, n)
-        pol_v_mens,  _, pol_v_tot,  pol_v_unica  = _pol_breakdown(pol_v_imp,  pol_v_mode,  n)
-
-        # Spese bancarie
-        istruttoria = to_float(self.e_istruttoria.get())
-        perizia     = to_float(self.e_perizia.get())
-        imp_sost_mode = self.imp_sost_mode.get()
-        if imp_sost_mode == "Prima casa":
-            imp_sost = importo * 0.0025
-        elif imp_sost_mode == "Seconda casa":
-            imp_sost = importo * 0.02
-        else:
-            imp_sost = to_float(self.e_imp_sost.get())
-
-        rata           = rata_base + pol_si_mens + pol_v_mens
-        tot_restituito = rata_base * n
-        tot_interessi  = tot_restituito - importo
-        acconto        = prezzo - importo
-        tot_costi_iniz = (acconto + notaio + agenzia + imposta
-                          + pol_si_unica + pol_v_unica
-                          + istruttoria + perizia + imp_sost)
-        costo_totale   = (tot_restituito + tot_interessi
-                          + pol_si_tot + pol_v_tot
-                          + notaio + agenzia + imposta
-                          + istruttoria + perizia + imp_sost)
-
-        # TAEG — costi upfront inclusi: istruttoria, perizia, imp.sost., pol.unica scoppio
-        taeg = calcola_taeg(
-            importo,
-            upfront_costs=istruttoria + perizia + imp_sost + pol_si_unica,
-            rata_base=rata_base,
-            n=int(n),
-            pol_si_imp=pol_si_imp,
-            pol_si_mode=pol_si_mode,
+        return (importo, pct, to_float(self.e_tasso.get()) / 100,
+                to_float(self.e_durata.get()))
+
+    def parametri(self) -> dict:
+        """Valori numerici dello scenario, nel formato del motore di calcolo."""
+        return {
+            "label":         self.get_label(),
+            "mutuo_mode":    self.mutuo_mode.get(),
+            "importo":       to_float(self.e_importo.get()),
+            "tasso":         to_float(self.e_tasso.get()),
+            "durata":        to_float(self.e_durata.get()),
+            "pol_si":        to_float(self.e_pol_si.get()),
+            "pol_si_mode":   self.pol_si_mode.get(),
+            "pol_v":         to_float(self.e_pol_v.get()),
+            "pol_v_mode":    self.pol_v_mode.get(),
+            "istruttoria":   to_float(self.e_istruttoria.get()),
+            "perizia":       to_float(self.e_perizia.get()),
+            "imp_sost_mode": self.imp_sost_mode.get(),
+            "imp_sost":      to_float(self.e_imp_sost.get()),
+        }
+
+
+# ── Classe immobile in portafoglio ─────────────────────────────────────────────
+class ImmobileWidget(ctk.CTkFrame):
+    """Un immobile aggiuntivo, confrontato con gli stessi scenari mutuo."""
+
+    def __init__(self, parent, index: int, on_remove,
+                 defaults: dict | None = None, **kw):
+        super().__init__(parent, **kw)
+        self._index = index
+        self._on_remove = on_remove
+        self._defaults = defaults or {}
+        self._build()
+
+    def _build(self):
+        d = self._defaults
+        header = ctk.CTkFrame(self, fg_color=("gray75", "gray25"), corner_radius=6)
+        header.pack(fill="x", padx=0, pady=(0, 6))
+        self._entry_nome = ctk.CTkEntry(
+            header,
+            font=ctk.CTkFont(size=12, weight="bold"),
+            fg_color="transparent",
+            border_width=0,
+            width=220,
         )
+        self._entry_nome.insert(0, f"Immobile {self._index + 2}")
+        self._entry_nome.pack(side="left", padx=10, pady=4)
+        ctk.CTkButton(
+            header, text="✕ Rimuovi", width=90, height=24,
+            fg_color="#c0392b", hover_color="#96281b",
+            font=ctk.CTkFont(size=11),
+            command=lambda: self._on_remove(self),
+        ).pack(side="right", padx=8, pady=4)
 
+        g = ctk.CTkFrame(self, fg_color="transparent")
+        g.pack(padx=12, pady=(0, 8), fill="x")
+
+        _lbl(g, "Prezzo (€):", 0)
+        self.e_prezzo = _entry(g, 0, 1, d.get("prezzo", "300000"), width=120)
+        _lbl(g, "Valore catastale (€):", 0, col=2, padx=(16, 8))
+        self.e_val_catastale = _entry(g, 0, 3, d.get("val_catastale", "0"),
+                                      width=100)
+
+        _lbl(g, "Tipo immobile:", 1)
+        self.imposta_tipo = ctk.StringVar(value=d.get("imposta_tipo", "Prima casa"))
+        _seg(g, list(TIPI), self.imposta_tipo, 1, 1, width=260)
+        _lbl(g, "Venditore:", 3)
+        self.venditore = ctk.StringVar(value=d.get("venditore", "Privato"))
+        _seg(g, list(VENDITORI), self.venditore, 3, 1, width=200)
+
+        _lbl(g, "Agenzia:", 2)
+        self.agenzia_mode = ctk.StringVar(value=d.get("agenzia_mode", "% Prezzo"))
+        _seg(g, ["€ Importo", "% Prezzo"], self.agenzia_mode, 2, 1, width=200)
+        self.e_agenzia = _entry(g, 2, 3, d.get("agenzia", "4"), width=70)
+        _lbl(g, "+ IVA %", 2, col=4, padx=(8, 4))
+        self.e_agenzia_iva = _entry(
+            g, 2, 5, d.get("agenzia_iva", f"{aliquota_iva_agenzia() * 100:g}"),
+            width=50)
+
+    def get_label(self) -> str:
+        return self._entry_nome.get() or f"Immobile {self._index + 2}"
+
+    def parametri(self, notaio: float, under36: bool, data: date) -> dict:
+        """Dati immobile nel formato del motore di calcolo."""
         return {
-            "label":          self._entry_nome.get() or f"Scenario {self._index + 1}",
-            "prezzo":         prezzo,
-            "importo":        importo,
-            "pct_mutuo":      pct,
-            "tasso_ann":      tasso_ann * 100,
-            "durata_ann":     durata_ann,
-            "rata_base":      rata_base,
-            "rata":           rata,
-            "tot_restituito": tot_restituito,
-            "tot_interessi":  tot_interessi,
-            "acconto":        acconto,
-            "notaio":         notaio,
-            "agenzia":        agenzia,
-            "agenzia_tot":    agenzia,
-            **(agenzia_extra or {}),
-            "imposta":        imposta,
-            "pol_si_imp":     pol_si_imp,  "pol_si_mode":  pol_si_mode,
-            "pol_si_mens":    pol_si_mens, "pol_si_tot":   pol_si_tot,
-            "pol_si_unica":   pol_si_unica,
-            "pol_v_imp":      pol_v_imp,   "pol_v_mode":   pol_v_mode,
-            "pol_v_mens":     pol_v_mens,  "pol_v_tot":    pol_v_tot,
-            "pol_v_unica":    pol_v_unica,
-            "istruttoria":    istruttoria,
-            "perizia":        perizia,
-            "imp_sost":       imp_sost,
-            "imp_sost_mode":  imp_sost_mode,
-            "taeg":           taeg,
-            "tot_costi_iniz": tot_costi_iniz,
-            "costo_totale":   costo_totale,
+            "immobile":      self.get_label(),
+            "prezzo":        to_float(self.e_prezzo.get()),
+            "notaio":        notaio,
+            "val_catastale": to_float(self.e_val_catastale.get()),
+            "imposta_tipo":  self.imposta_tipo.get(),
+            "venditore":     self.venditore.get(),
+            "under36":       under36,
+            "data":          data,
+            "agenzia_mode":  self.agenzia_mode.get(),
+            "agenzia":       to_float(self.e_agenzia.get()),
+            "agenzia_iva":   to_float(self.e_agenzia_iva.get()),
         }
 
 
@@ -421,6 +428,8 @@ class App(ctk.CTk):
         self.resizable(False, False)
 
         self._scenari: list[MutuoWidget] = []
+        self._immobili: list[ImmobileWidget] = []
+        self._grafici_job = None
 
         outer = ctk.CTkScrollableFrame(self, width=700, height=940)
         outer.pack(padx=20, pady=20, fill="both", expand=True)
@@ -500,26 +509,88 @@ class App(ctk.CTk):
         ctk.CTkLabel(gc, text="+ IVA", anchor="w").grid(
             row=1, column=4, padx=(0, 4), pady=4, sticky="w")
         self.e_agenzia_iva = ctk.CTkEntry(gc, width=55)
-        self.e_agenzia_iva.insert(0, "22")
+        self.e_agenzia_iva.insert(0, f"{aliquota_iva_agenzia() * 100:g}")
         self.e_agenzia_iva.grid(row=1, column=5, pady=4, sticky="w")
         ctk.CTkLabel(gc, text="%", anchor="w",
                      text_color=("gray40", "gray60")).grid(
             row=1, column=6, padx=(4, 0), pady=4, sticky="w")
 
-        # ── Imposta di registro (acquisto da privato) ────────────────────────
-        ctk.CTkLabel(gc, text="Imposta di registro:", anchor="w").grid(
+        # ── Imposte d'acquisto (regole in imposte.REGOLE) ───────────────────
+        ctk.CTkLabel(gc, text="Tipo immobile:", anchor="w").grid(
             row=2, column=0, padx=(0, 12), pady=4, sticky="w")
         self.imposta_tipo = ctk.StringVar(value="Prima casa")
         ctk.CTkSegmentedButton(
-            gc, values=["Prima casa", "Seconda casa"],
+            gc, values=list(TIPI),
             variable=self.imposta_tipo,
+            width=260,
+        ).grid(row=2, column=1, columnspan=4, pady=4, sticky="w")
+        ctk.CTkLabel(gc, text="Venditore:", anchor="w").grid(
+            row=3, column=0, padx=(0, 12), pady=4, sticky="w")
+        self.venditore = ctk.StringVar(value="Privato")
+        ctk.CTkSegmentedButton(
+            gc, values=list(VENDITORI),
+            variable=self.venditore,
             width=220,
-        ).grid(row=2, column=1, columnspan=2, pady=4, sticky="w")
+        ).grid(row=3, column=1, columnspan=4, pady=4, sticky="w")
         ctk.CTkLabel(gc, text="Valore catastale (€):", anchor="w").grid(
-            row=3, column=0, padx=(0, 12), pady=4, sticky="w")
+            row=4, column=0, padx=(0, 12), pady=4, sticky="w")
         self.e_val_catastale = ctk.CTkEntry(gc, width=160)
         self.e_val_catastale.insert(0, "0")
-        self.e_val_catastale.grid(row=3, column=1, pady=4, sticky="w")
+        self.e_val_catastale.grid(row=4, column=1, pady=4, sticky="w")
+        self.under36 = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(gc, text="Acquirente under 36",
+                        variable=self.under36).grid(
+            row=5, column=1, columnspan=4, pady=4, sticky="w")
+        ctk.CTkLabel(gc, text="Data rogito (gg/mm/aaaa):", anchor="w").grid(
+            row=6, column=0, padx=(0, 12), pady=4, sticky="w")
+        self.e_data = ctk.CTkEntry(gc, width=160)
+        self.e_data.insert(0, f"{date.today():%d/%m/%Y}")
+        self.e_data.grid(row=6, column=1, pady=4, sticky="w")
+
+        # ── Sezione: Portafoglio immobili ──────────────────────────────────
+        fp = ctk.CTkFrame(outer)
+        fp.pack(fill="x", pady=(0, 10))
+        hdr_p = ctk.CTkFrame(fp, fg_color="transparent")
+        hdr_p.pack(fill="x", padx=16, pady=(12, 4))
+        ctk.CTkLabel(hdr_p, text="Portafoglio immobili",
+                     font=ctk.CTkFont(size=15, weight="bold")).pack(side="left")
+        ctk.CTkButton(
+            hdr_p, text="＋ Aggiungi immobile", width=160, height=28,
+            font=ctk.CTkFont(size=12),
+            command=self._aggiungi_immobile,
+        ).pack(side="right")
+        ctk.CTkFrame(fp, height=2, fg_color=("gray70", "gray40")).pack(
+            fill="x", padx=16, pady=(0, 6))
+        ctk.CTkLabel(
+            fp, anchor="w",
+            text="Altri immobili da confrontare con gli stessi scenari mutuo "
+                 "(l'immobile principale è quello dei dati sopra).",
+            text_color=("gray50", "gray55"),
+            font=ctk.CTkFont(size=11, slant="italic"),
+        ).pack(fill="x", padx=16, pady=(0, 6))
+        self._immobili_container = ctk.CTkFrame(fp, fg_color="transparent")
+        self._immobili_container.pack(padx=16, pady=(0, 12), fill="x")
+
+        # ── Sezione: Grafici ───────────────────────────────────────────────
+        fg = ctk.CTkFrame(outer)
+        fg.pack(fill="x", pady=(0, 10))
+        hdr_g = ctk.CTkFrame(fg, fg_color="transparent")
+        hdr_g.pack(fill="x", padx=16, pady=(12, 4))
+        ctk.CTkLabel(hdr_g, text="Grafici",
+                     font=ctk.CTkFont(size=15, weight="bold")).pack(side="left")
+        self.vista_grafico = ctk.StringVar(value=VISTE[0])
+        ctk.CTkSegmentedButton(
+            hdr_g, values=list(VISTE), variable=self.vista_grafico,
+            command=lambda _: self._aggiorna_grafici(),
+        ).pack(side="right")
+        ctk.CTkFrame(fg, height=2, fg_color=("gray70", "gray40")).pack(
+            fill="x", padx=16, pady=(0, 10))
+        self.grafico = GraficoCanvas(fg, width=660, height=260)
+        self.grafico.pack(padx=16, pady=(0, 12))
+
+        # Ridisegno incrementale a ogni modifica degli input (con debounce)
+        self.bind_all("<KeyRelease>", self._programma_grafici, add="+")
+        self.bind_all("<ButtonRelease-1>", self._programma_grafici, add="+")
 
         # ── Bottoni ────────────────────────────────────────────────────────
         btn_frame = ctk.CTkFrame(outer, fg_color="transparent")
@@ -536,9 +607,14 @@ class App(ctk.CTk):
             fg_color="#2a7a2a", hover_color="#215f21",
         ).grid(row=0, column=1, padx=8)
 
+        ctk.CTkButton(
+            btn_frame, text="Esporta",
+            command=self.esporta_foglio,
+        ).grid(row=0, column=2, padx=8)
+
         # ── Riepilogo inline ───────────────────────────────────────────────
         self.riepilogo_box = ctk.CTkTextbox(
-            outer, height=300, state="disabled",
+            outer, height=300, state="disabled", wrap="none",
             font=ctk.CTkFont(family="Courier", size=11),
         )
         self.riepilogo_box.pack(fill="x", pady=(10, 0))
@@ -566,37 +642,20 @@ class App(ctk.CTk):
                 pct = 4.0
             self.e_agenzia.insert(0, str(pct))
 
-    def _get_agenzia(self) -> tuple[float, float, float]:
-        """Restituisce (totale_lordo, imponibile, iva_importo)."""
-        prezzo = to_float(self.e_prezzo.get())
-        val    = to_float(self.e_agenzia.get())
-        iva    = to_float(self.e_agenzia_iva.get())
-        if self.agenzia_mode.get() == "% Prezzo":
-            imponibile = prezzo * val / 100
-            iva_imp    = imponibile * iva / 100
-            totale     = imponibile + iva_imp
-        else:  # € Importo già lordo
-            totale     = val
-            iva_imp    = 0.0
-            imponibile = val
-        return totale, imponibile, iva_imp
-
-    def _get_imposta(self) -> dict:
-        """Imposte acquisto da privato: registro + ipotecaria (€50) + catastale (€50)."""
-        val_cat = to_float(self.e_val_catastale.get())
-        tipo    = self.imposta_tipo.get()
-        pct     = 0.02 if tipo == "Prima casa" else 0.09
-        registro   = round(val_cat * pct, 2)
-        ipotecaria = 50.0
-        catastale  = 50.0
+    def _immobile_principale(self) -> dict:
+        """Dati immobile principale nel formato del motore di calcolo."""
         return {
-            "tipo":          tipo,
-            "pct":           pct,
-            "val_catastale": val_cat,
-            "registro":      registro,
-            "ipotecaria":    ipotecaria,
-            "catastale":     catastale,
-            "totale":        registro + ipotecaria + catastale,
+            "immobile":      "Immobile principale",
+            "prezzo":        to_float(self.e_prezzo.get()),
+            "notaio":        to_float(self.e_notaio.get()),
+            "val_catastale": to_float(self.e_val_catastale.get()),
+            "imposta_tipo":  self.imposta_tipo.get(),
+            "venditore":     self.venditore.get(),
+            "under36":       self.under36.get(),
+            "data":          to_date(self.e_data.get()),
+            "agenzia_mode":  self.agenzia_mode.get(),
+            "agenzia":       to_float(self.e_agenzia.get()),
+            "agenzia_iva":   to_float(self.e_agenzia_iva.get()),
         }
 
     # ── Helpers UI ─────────────────────────────────────────────────────────
@@ -622,6 +681,7 @@ class App(ctk.CTk):
         )
         w.pack(fill="x", pady=(0, 8))
         self._scenari.append(w)
+        self._programma_grafici()
 
     def _rimuovi_scenario(self, widget: MutuoWidget):
         if len(self._scenari) == 1:
@@ -632,83 +692,91 @@ class App(ctk.CTk):
         widget.destroy()
         for i, s in enumerate(self._scenari):
             s.set_index(i)
+        self._programma_grafici()
+
+    # ── Gestione immobili in portafoglio ───────────────────────────────────
+    def _aggiungi_immobile(self):
+        # Nuovo immobile precompilato con i dati dell'immobile principale
+        w = ImmobileWidget(
+            self._immobili_container,
+            index=len(self._immobili),
+            on_remove=self._rimuovi_immobile,
+            defaults={
+                "prezzo":        self.e_prezzo.get(),
+                "val_catastale": self.e_val_catastale.get(),
+                "imposta_tipo":  self.imposta_tipo.get(),
+                "venditore":     self.venditore.get(),
+                "agenzia_mode":  self.agenzia_mode.get(),
+                "agenzia":       self.e_agenzia.get(),
+                "agenzia_iva":   self.e_agenzia_iva.get(),
+            },
+        )
+        w.pack(fill="x", pady=(0, 8))
+        self._immobili.append(w)
+
+    def _rimuovi_immobile(self, widget: ImmobileWidget):
+        self._immobili.remove(widget)
+        widget.destroy()
+
+    # ── Grafici ────────────────────────────────────────────────────────────
+    def _programma_grafici(self, _event=None):
+        if self._grafici_job is not None:
+            self.after_cancel(self._grafici_job)
+        self._grafici_job = self.after(60, self._aggiorna_grafici)
+
+    def _aggiorna_grafici(self):
+        self._grafici_job = None
+        prezzo = to_float(self.e_prezzo.get())
+        importi, _, tassi, durate = zip(
+            *(s.parametri_mutuo(prezzo) for s in self._scenari))
+        x, Y, etichetta_x = calcola_serie(
+            self.vista_grafico.get(), importi, tassi, [d * 12 for d in durate])
+        self.grafico.aggiorna(
+            x, Y,
+            [s.color for s in self._scenari],
+            [s.get_label() for s in self._scenari],
+            etichetta_x,
+        )
 
     # ── Calcola tutti gli scenari ──────────────────────────────────────────
-    def _calcola_tutti(self) -> list:
-        prezzo  = to_float(self.e_prezzo.get())
-        notaio  = to_float(self.e_notaio.get())
-        agenzia_tot, agenzia_impon, agenzia_iva = self._get_agenzia()
-        agenzia_pct   = to_float(self.e_agenzia.get()) if self.agenzia_mode.get() == "% Prezzo" else 0
-        agenzia_iva_pct = to_float(self.e_agenzia_iva.get())
-        imp_dict = self._get_imposta()
-        imposta  = imp_dict["totale"]
-        extra = {
-            "agenzia_tot":     agenzia_tot,
-            "agenzia_impon":   agenzia_impon,
-            "agenzia_iva":     agenzia_iva,
-            "agenzia_pct":     agenzia_pct,
-            "agenzia_iva_pct": agenzia_iva_pct,
-            "agenzia_mode":    self.agenzia_mode.get(),
-            "imp_tipo":        imp_dict["tipo"],
-            "imp_pct":         imp_dict["pct"],
-            "imp_registro":    imp_dict["registro"],
-            "imp_ipotecaria":  imp_dict["ipotecaria"],
-            "imp_catastale":   imp_dict["catastale"],
-        }
-        return [s.calcola(prezzo, notaio, agenzia_tot, imposta, extra)
-                for s in self._scenari]
+    def _calcola_tutti(self) -> RisultatiScenari | None:
+        """
+        Immobile principale e immobili del portafoglio × scenari, in un'unica
+        passata vettoriale: la riga i*M + j è l'immobile i con lo scenario j,
+        e le prime M righe sono quelle dell'immobile principale. Se i dati
+        non si possono calcolare (es. data del rogito non valida o senza
+        regole fiscali) avvisa e ritorna None.
+        """
+        notaio   = to_float(self.e_notaio.get())
+        scenari  = [s.parametri() for s in self._scenari]
+        try:
+            under36, data = self.under36.get(), to_date(self.e_data.get())
+            immobili = [self._immobile_principale()]
+            immobili += [w.parametri(notaio, under36, data) for w in self._immobili]
+            return calcola_righe(prodotto_incrociato(immobili, scenari))
+        except ValueError as e:
+            messagebox.showwarning("Attenzione", str(e))
+            return None
 
     # ── Riepilogo testuale ─────────────────────────────────────────────────
     def mostra_riepilogo(self):
-        scenari = self._calcola_tutti()
+        ris     = self._calcola_tutti()
+        if ris is None:
+            return
+        m       = len(self._scenari)
+        scenari = ris[:m]
         lines = [
             "═══════════════════════════════════════════════════",
             "  RIEPILOGO COSTI ACQUISTO IMMOBILE",
             "═══════════════════════════════════════════════════",
         ]
-        for d in scenari:
-            lines += [
-                "",
-                f"── {d['label']}  ({d['pct_mutuo']:.1f}%"
-                f" · {fmt_eur(d['importo'])}) ──",
-                f"  Tasso annuo (TAN):    {d['tasso_ann']:.2f} %"
-                f"  –  {int(d['durata_ann'])} anni",
-                f"  TAEG:                 "
-                + (f"{d['taeg']:.2f} %" if d.get('taeg') is not None else "n.d."),
-                f"  Rata mutuo:           {fmt_eur(d['rata_base'])}",
-                f"  + Pol. scoppio/inc.:  "
-                f"{_pol_line(d['pol_si_imp'], d['pol_si_mode'], d['pol_si_mens'])}",
-                f"  + Pol. vita:          "
-                f"{_pol_line(d['pol_v_imp'], d['pol_v_mode'], d['pol_v_mens'])}",
-                f"  Rata totale:          {fmt_eur(d['rata'])}",
-                f"  Interessi totali:     {fmt_eur(d['tot_interessi'])}",
-                f"  Totale restituito:    {fmt_eur(d['tot_restituito'])}",
-                "  ───────────────────────────────────────────────",
-                f"  Acconto:              {fmt_eur(d['acconto'])}",
-                f"  Notaio:               {fmt_eur(d['notaio'])}",
-                f"  Agenzia:              {fmt_eur(d['agenzia_tot'])}"
-                + (f"  ({d['agenzia_pct']:.2f}% + IVA {d['agenzia_iva_pct']:.0f}%)"
-                   if d.get('agenzia_mode') == '% Prezzo' else ""),
-                f"  Imp. di registro:     {fmt_eur(d.get('imp_registro', 0))}"
-                f"  ({d.get('imp_tipo','')}, {d.get('imp_pct', 0)*100:.1f}% v.c.)",
-                f"  Imp. ipotecaria:      {fmt_eur(d.get('imp_ipotecaria', 50))}  (fissa)",
-                f"  Imp. catastale:       {fmt_eur(d.get('imp_catastale', 50))}  (fissa)",
-                f"  Spese istruttoria:    {fmt_eur(d['istruttoria'])}",
-                f"  Spese perizia:        {fmt_eur(d['perizia'])}",
-                f"  Imposta sostitutiva:  {fmt_eur(d['imp_sost'])}"
-                f"  [{d['imp_sost_mode']}]",
-                *([f"  Pol. scoppio/inc.:    "
-                   f"{fmt_eur(d['pol_si_unica'])} (unica)"]
-                  if d["pol_si_unica"] > 0 else []),
-                *([f"  Pol. vita:            "
-                   f"{fmt_eur(d['pol_v_unica'])} (unica)"]
-                  if d["pol_v_unica"] > 0 else []),
-                f"  Tot. costi iniziali:  {fmt_eur(d['tot_costi_iniz'])}",
-                f"  ► COSTO TOTALE:       {fmt_eur(d['costo_totale'])}",
-            ]
+        lines += MODELLO.testo(scenari)
         lines.append("")
         lines.append("═══════════════════════════════════════════════════")
 
+        if len(ris) > m:
+            lines += ["", *_righe_portafoglio(ris, m)]
+
         text = "\n".join(lines)
         self.riepilogo_box.configure(state="normal")
         self.riepilogo_box.delete("1.0", "end")
@@ -717,7 +785,13 @@ class App(ctk.CTk):
 
     # ── Genera PDF ─────────────────────────────────────────────────────────
     def genera_pdf(self):
-        scenari = self._calcola_tutti()
+        ris     = self._calcola_tutti()
+        if ris is None:
+            return
+        m       = len(self._scenari)
+        scenari = ris[:m]
+        # Gli stessi colori dello scenario nell'app, anche dopo una rimozione
+        colori  = [s.color for s in self._scenari]
         path = filedialog.asksaveasfilename(
             defaultextension=".pdf",
             filetypes=[("PDF", "*.pdf")],
@@ -768,9 +842,9 @@ class App(ctk.CTk):
         story.append(HRFlowable(width="100%", thickness=1,
                                 color=colors.HexColor("#1a5276")))
 
-        for i, d in enumerate(scenari):
-            hex_color = SCENARIO_COLORS[i % len(SCENARIO_COLORS)]
-            scen_color = colors.HexColor(hex_color)
+        tabelle_scenari = MODELLO.tabelle(scenari)
+        for i, d in enumerate(MODELLO.righe(scenari)):
+            scen_color = colors.HexColor(colori[i])
             hdr_style = TableStyle([
                 ("BACKGROUND", (0, 0), (-1, 0), scen_color),
                 ("TEXTCOLOR",  (0, 0), (-1, 0), colors.white),
@@ -788,63 +862,15 @@ class App(ctk.CTk):
                 fontSize=13, spaceBefore=10, spaceAfter=4,
                 textColor=scen_color,
             )
-            story.append(Paragraph(
-                f"{d['label']} — {fmt_eur(d['importo'])}"
-                f" ({d['pct_mutuo']:.1f}% del prezzo · {int(d['durata_ann'])} anni)",
-                sec_style,
-            ))
+            story.append(Paragraph(titolo(d), sec_style))
 
-            mutuo_data = [
-                ["Voce", "Importo"],
-                [f"Importo mutuo ({d['pct_mutuo']:.1f}% del prezzo)",
-                 fmt_eur(d["importo"])],
-                ["Tasso annuo (TAN)", f"{d['tasso_ann']:.2f} %"],
-                ["TAEG", f"{d['taeg']:.2f} %" if d.get('taeg') is not None else "n.d."],
-                ["Durata", f"{int(d['durata_ann'])} anni"],
-                ["Rata mutuo (cap. + int.)", fmt_eur(d["rata_base"])],
-                [f"  + Pol. scoppio/incendio [{d['pol_si_mode']}]",
-                 _pol_line(d["pol_si_imp"], d["pol_si_mode"], d["pol_si_mens"])],
-                [f"  + Polizza vita [{d['pol_v_mode']}]",
-                 _pol_line(d["pol_v_imp"], d["pol_v_mode"], d["pol_v_mens"])],
-                ["Rata totale mensile", fmt_eur(d["rata"])],
-                ["Interessi totali", fmt_eur(d["tot_interessi"])],
-                ["Totale restituito", fmt_eur(d["tot_restituito"])],
-                ["Totale polizze (intera durata)",
-                 fmt_eur(d["pol_si_tot"] + d["pol_v_tot"])],
-            ]
-            t = Table(mutuo_data, colWidths=col_w)
+            tabelle = tabelle_scenari[i]
+            t = Table(tabelle["Mutuo"], colWidths=col_w)
             t.setStyle(tbl_s)
             story.append(t)
             story.append(Spacer(1, 0.3 * cm))
 
-            costi_data = [
-                ["Voce", "Importo"],
-                ["Acconto (prezzo − mutuo)", fmt_eur(d["acconto"])],
-                ["Notaio", fmt_eur(d["notaio"])],
-                ["Agenzia immobiliare",
-                 (f"{fmt_eur(d.get('agenzia_impon', d['agenzia']))} + IVA {d.get('agenzia_iva_pct',0):.0f}%"
-                  f" = {fmt_eur(d['agenzia_tot'])}"
-                  if d.get('agenzia_mode') == '% Prezzo'
-                  else fmt_eur(d['agenzia_tot']))],
-                [f"Imposta di registro ({d.get('imp_tipo','')}, {d.get('imp_pct',0)*100:.1f}% v.c.)",
-                 fmt_eur(d.get('imp_registro', 0))],
-                ["Imposta ipotecaria (fissa)", fmt_eur(d.get('imp_ipotecaria', 50))],
-                ["Imposta catastale (fissa)",  fmt_eur(d.get('imp_catastale',  50))],
-                ["Spese istruttoria", fmt_eur(d["istruttoria"])],
-                ["Spese perizia", fmt_eur(d["perizia"])],
-                [f"Imposta sostitutiva [{d['imp_sost_mode']}]",
-                 fmt_eur(d["imp_sost"])],
-            ]
-            if d["pol_si_unica"] > 0:
-                costi_data.append(["Pol. scoppio/incendio (unica)",
-                                   fmt_eur(d["pol_si_unica"])])
-            if d["pol_v_unica"] > 0:
-                costi_data.append(["Polizza vita (unica)",
-                                   fmt_eur(d["pol_v_unica"])])
-            costi_data.append(["TOTALE costi iniziali",
-                                fmt_eur(d["tot_costi_iniz"])]) 
-
-            t2 = Table(costi_data, colWidths=col_w)
+            t2 = Table(tabelle["Costi iniziali"], colWidths=col_w)
             t2.setStyle(tbl_s2)
             story.append(t2)
             story.append(Spacer(1, 0.3 * cm))
@@ -856,14 +882,91 @@ class App(ctk.CTk):
                 textColor=scen_color,
             )
             story.append(Paragraph(
-                f"<b>COSTO TOTALE {d['label'].upper()}:"
+                f"<b>{MODELLO.totale.etichetta} {d['label'].upper()}:"
                 f"  {fmt_eur(d['costo_totale'])}</b>",
                 ts,
             ))
 
+        # ── Confronto portafoglio ──────────────────────────────────────────
+        if len(ris) > m:
+            story.append(Spacer(1, 0.6 * cm))
+            story.append(Paragraph("Confronto portafoglio", title_style))
+            story.append(Paragraph(
+                "Costo totale e rata mensile per ogni immobile × scenario mutuo. "
+                "In verde lo scenario più conveniente per ciascun immobile.",
+                sub_style))
+            story.append(Spacer(1, 0.3 * cm))
+            n         = len(ris) // m
+            nomi_imm  = ris[::m]["immobile"].tolist()
+            nomi_scen = scenari["label"].tolist()
+            costo     = ris["costo_totale"].reshape(n, m)
+            rata      = ris["rata"].reshape(n, m)
+            migliori  = costo.argmin(axis=1)
+            for inizio in range(0, m, 4):  # max 4 scenari per tabella
+                cols = range(inizio, min(inizio + 4, m))
+                dati = [["Immobile", *(nomi_scen[j] for j in cols)]]
+                dati += [[nomi_imm[i], *(f"{fmt_eur(costo[i, j])}\n"
+                                         f"rata {fmt_eur(rata[i, j])}"
+                                         for j in cols)]
+                         for i in range(n)]
+                stile = [
+                    ("FONTNAME",   (0, 0), (-1, 0), "Helvetica-Bold"),
+                    ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#1a5276")),
+                    ("TEXTCOLOR",  (0, 0), (-1, 0), colors.white),
+                    ("FONTSIZE",   (0, 0), (-1, -1), 8),
+                    ("ALIGN",      (1, 1), (-1, -1), "RIGHT"),
+                    ("VALIGN",     (0, 0), (-1, -1), "MIDDLE"),
+                    ("GRID",       (0, 0), (-1, -1), 0.4, colors.HexColor("#aab7b8")),
+                ]
+                stile += [("BACKGROUND", (int(migliori[i]) - inizio + 1, i + 1),
+                           (int(migliori[i]) - inizio + 1, i + 1),
+                           colors.HexColor("#d5f5e3"))
+                          for i in range(n) if migliori[i] in cols]
+                t = Table(dati, colWidths=[4 * cm] + [3 * cm] * len(cols))
+                t.setStyle(TableStyle(stile))
+                story.append(t)
+                story.append(Spacer(1, 0.3 * cm))
+
+        # ── Grafici ────────────────────────────────────────────────────────
+        importi   = [d["importo"] for d in scenari]
+        tassi     = [d["tasso_ann"] / 100 for d in scenari]
+        n_mesi    = [d["durata_ann"] * 12 for d in scenari]
+        etichette = [d["label"] for d in scenari]
+        story.append(Spacer(1, 0.6 * cm))
+        for vista in VISTE:
+            x, Y, etichetta_x = calcola_serie(vista, importi, tassi, n_mesi)
+            story.append(disegno_pdf(x, Y, colori, etichette, etichetta_x,
+                                     vista, 16 * cm, 6 * cm))
+            story.append(Spacer(1, 0.3 * cm))
+
         doc.build(story)
         messagebox.showinfo("PDF generato", f"File salvato in:\n{path}")
 
+    # ── Esporta foglio di calcolo ──────────────────────────────────────────
+    def esporta_foglio(self):
+        ris = self._calcola_tutti()
+        if ris is None:
+            return
+        # Un foglio di ammortamento per scenario: con molti scenari pesa
+        piani = messagebox.askyesnocancel(
+            "Esporta foglio di calcolo",
+            "Includere un foglio con il piano di ammortamento per ogni scenario?")
+        if piani is None:
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".xlsx",
+            filetypes=[("Excel", "*.xlsx"), ("OpenDocument", "*.ods")],
+            initialfile=f"confronto_immobile_{datetime.now():%Y%m%d}.xlsx",
+        )
+        if not path:
+            return
+        try:
+            esporta(path, ris, piani=piani)
+        except (OSError, ValueError) as e:
+            messagebox.showwarning("Attenzione", str(e))
+            return
+        messagebox.showinfo("Foglio esportato", f"File salvato in:\n{path}")
+
 
 # ── Entry point ────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
@@ -0,0 +1,224 @@
+"""
+Calcolo batch da riga di comando: ogni immobile × ogni offerta mutuo.
+
+Uso:
+    python batch.py offerte.csv --immobili immobili.csv -o risultati.csv
+
+I CSV (separatore `,` `;` o tab) hanno per intestazione i nomi dei campi di
+MutuoWidget.parametri (offerte) e del motore (immobili); le colonne mancanti
+prendono i valori di default dell'app. I risultati già calcolati in
+esecuzioni precedenti vengono letti dalla cache su disco. Con --esporta i
+risultati vanno anche in un foglio di calcolo .xlsx o .ods (esporta.py).
+"""
+import argparse
+import csv
+import sys
+import time
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+
+from cache_risultati import PERCORSO_DEFAULT, CacheRisultati
+from esporta import Esportazione, nomi_piani
+from imposte import TABELLA, TIPI, VENDITORI
+from motore import calcola_righe
+from riepilogo import MODELLO
+
+# Default come nei campi dell'app
+SCENARIO_DEFAULT = {
+    "label":         "",
+    "mutuo_mode":    "€ Importo",
+    "importo":       160000.0,
+    "tasso":         3.5,
+    "durata":        25.0,
+    "pol_si":        300.0,
+    "pol_si_mode":   "Annuale",
+    "pol_v":         0.0,
+    "pol_v_mode":    "Annuale",
+    "istruttoria":   500.0,
+    "perizia":       300.0,
+    "imp_sost_mode": "Prima casa",
+    "imp_sost":      0.0,
+}
+IMMOBILE_DEFAULT = {
+    "immobile":      "",
+    "prezzo":        300000.0,
+    "notaio":        3000.0,
+    "val_catastale": 0.0,
+    "imposta_tipo":  "Prima casa",
+    "venditore":     "Privato",
+    "under36":       False,
+    "data":          date.today(),
+    "agenzia_mode":  "% Prezzo",
+    "agenzia":       4.0,
+    "agenzia_iva":   22.0,
+}
+# Colonne a scelta, con i valori dei selettori dell'app
+VALORI_AMMESSI = {
+    "mutuo_mode":    ("€ Importo", "% Prezzo"),
+    "pol_si_mode":   ("In rata", "Annuale", "Unica"),
+    "pol_v_mode":    ("In rata", "Annuale", "Unica"),
+    "imp_sost_mode": ("Prima casa", "Seconda casa", "€ fisso"),
+    "agenzia_mode":  ("% Prezzo", "€ Importo"),
+    "imposta_tipo":  TIPI,
+    "venditore":     VENDITORI,
+}
+# Colonne sì/no (under36): ogni altro valore è un errore
+_VERO = ("1", "si", "sì", "true", "vero", "x")
+_FALSO = ("0", "no", "false", "falso", "")
+
+
+# ── Lettura ───────────────────────────────────────────────────────────────────
+def _converti(valore: str, default, dove: str, ammessi: tuple | None = None):
+    valore = valore.strip()
+    if isinstance(default, bool):
+        if valore.lower() in _VERO:
+            return True
+        if valore.lower() in _FALSO:
+            return False
+        raise ValueError(f"{dove}: valore non previsto {valore!r} (ammessi: "
+                         f"{', '.join(_VERO)} oppure {', '.join(_FALSO[:-1])} o vuoto)")
+    if isinstance(default, float):
+        try:
+            return float(valore.replace(",", "."))
+        except ValueError:
+            raise ValueError(f"{dove}: valore non numerico {valore!r}") from None
+    if isinstance(default, date):
+        for formato in ("%d/%m/%Y", "%Y-%m-%d"):
+            try:
+                data = datetime.strptime(valore, formato).date()
+                break
+            except ValueError:
+                pass
+        else:
+            raise ValueError(f"{dove}: data non valida {valore!r}")
+        if data < TABELLA.prima_data:
+            raise ValueError(f"{dove}: nessuna regola fiscale per date anteriori "
+                             f"al {TABELLA.prima_data:%d/%m/%Y} ({valore!r})")
+        return data
+    if ammessi is not None and valore not in ammessi:
+        raise ValueError(f"{dove}: valore non previsto {valore!r} "
+                         f"(ammessi: {', '.join(ammessi)})")
+    return valore
+
+
+def leggi_csv(percorso, default: dict, etichetta: str,
+              prefisso: str) -> list[dict]:
+    """Righe del CSV come dict completi; le colonne sconosciute sono ignorate."""
+    with open(percorso, newline="", encoding="utf-8-sig") as f:
+        dialetto = csv.Sniffer().sniff(f.read(4096), delimiters=",;\t")
+        f.seek(0)
+        righe = []
+        for i, r in enumerate(csv.DictReader(f, dialect=dialetto), 1):
+            d = dict(default)
+            for k, v in r.items():
+                if k in default and v is not None and v.strip():
+                    d[k] = _converti(v, default[k], f"{percorso}:{i + 1} [{k}]",
+                                     VALORI_AMMESSI.get(k))
+            if not d[etichetta]:
+                d[etichetta] = f"{prefisso} {i}"
+            righe.append(d)
+    return righe
+
+
+def colonne(righe: list[dict]) -> dict:
+    return {k: np.array([r[k] for r in righe]) for k in righe[0]}
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main(argv=None):
+    ap = argparse.ArgumentParser(
+        description="Calcolo batch immobili × offerte mutuo")
+    ap.add_argument("offerte", help="CSV delle offerte mutuo")
+    ap.add_argument("--immobili",
+                    help="CSV degli immobili (default: un immobile standard)")
+    ap.add_argument("-o", "--output", default="risultati.csv",
+                    help="CSV dei risultati (default: %(default)s)")
+    ap.add_argument("--cache", type=Path, default=PERCORSO_DEFAULT,
+                    help="file SQLite della cache (default: %(default)s)")
+    ap.add_argument("--cache-mb", type=float, default=256,
+                    help="dimensione massima della cache in MB")
+    ap.add_argument("--senza-cache", action="store_true",
+                    help="calcola tutto senza leggere né scrivere la cache")
+    ap.add_argument("--riepilogo", action="store_true",
+                    help="solo le voci del riepilogo, con le etichette dell'app")
+    ap.add_argument("--blocco", type=int, default=100_000,
+                    help="righe per passata vettoriale")
+    ap.add_argument("--esporta", metavar="FILE",
+                    help="scrive anche un foglio di calcolo .xlsx o .ods")
+    ap.add_argument("--piani", action="store_true",
+                    help="con --esporta, un foglio di ammortamento per riga")
+    args = ap.parse_args(argv)
+
+    try:
+        offerte = leggi_csv(args.offerte, SCENARIO_DEFAULT, "label", "Offerta")
+        immobili = (leggi_csv(args.immobili, IMMOBILE_DEFAULT, "immobile", "Immobile")
+                    if args.immobili else [dict(IMMOBILE_DEFAULT, immobile="Immobile")])
+    except (OSError, ValueError, csv.Error) as e:
+        ap.error(str(e))
+    if not offerte or not immobili:
+        ap.error("nessuna riga da calcolare")
+
+    if args.piani and not args.esporta:
+        ap.error("--piani richiede --esporta")
+    esportazione = None
+    if args.esporta:
+        try:
+            esportazione = Esportazione(args.esporta)
+        except (OSError, ValueError) as e:
+            ap.error(str(e))
+
+    cache = None if args.senza_cache else CacheRisultati(
+        args.cache, max_byte=int(args.cache_mb * 2**20))
+    col_imm, col_off = colonne(immobili), colonne(offerte)
+    m = len(offerte)
+    totale = len(immobili) * m
+    piani = []  # per i fogli piano bastano tre colonne e il nome
+
+    def blocchi(f):
+        for a in range(0, totale, args.blocco):
+            idx = np.arange(a, min(a + args.blocco, totale))
+            righe = {k: v[idx // m] for k, v in col_imm.items()}
+            righe.update({k: v[idx % m] for k, v in col_off.items()})
+            ris = calcola_righe(righe, cache)
+            if args.riepilogo:
+                MODELLO.a_csv(f, ris, intestazione=a == 0)
+            else:
+                ris.a_csv(f, intestazione=a == 0)
+            if args.piani:
+                # Copie: le colonne di ris possono essere viste su tutta la
+                # matrice dei valori della cache
+                piani.append((*(np.array(ris[k], copy=True)
+                                for k in ("importo", "tasso_ann", "durata_ann")),
+                              nomi_piani(ris, a + 1)))
+            yield ris
+
+    inizio = time.perf_counter()
+    with open(args.output, "w", newline="", encoding="utf-8") as f:
+        if esportazione is None:
+            for _ in blocchi(f):
+                pass
+        else:
+            # Il confronto riceve i blocchi mentre vengono scritti nel CSV
+            with esportazione:
+                esportazione.risultati(blocchi(f))
+                for parte in piani:
+                    esportazione.piani(*parte)
+    durata = time.perf_counter() - inizio
+
+    print(f"{totale} righe in {durata:.2f} s "
+          f"({totale / durata:,.0f} righe/s) → {args.output}", file=sys.stderr)
+    if args.esporta:
+        print(f"foglio di calcolo: {esportazione.righe} righe "
+              f"({esportazione.righe / durata:,.0f} righe/s) → {args.esporta}",
+              file=sys.stderr)
+    if cache is not None:
+        s = cache.statistiche()
+        print(f"cache: {s['hit_rate']:.1%} hit ({s['hit']}/{s['hit'] + s['miss']}),"
+              f" {s['voci']} voci, {s['byte'] / 2**20:.1f} MB", file=sys.stderr)
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Cache persistente su disco dei risultati scenario (SQLite).
+
+Indirizzata per contenuto: ogni riga ha un'impronta da 128 bit della sua
+forma canonica (colonne d'ingresso normalizzate, etichette escluse, la data
+del rogito ridotta al periodo fiscale di TABELLA), calcolata in una passata
+vettoriale con semi derivati da MOTORE_VERSIONE e dalla tabella REGOLE, così
+un cambio di formule o aliquote invalida da solo le voci vecchie.
+Le righe calcolate insieme sono salvate insieme, in un blocco colonnare:
+impronte e campi numerici del risultato in due blob (i campi testo ripetono
+l'ingresso e vengono ricostruiti). Le impronte di tutti i blocchi stanno in
+memoria ordinate, così cercare N righe è una searchsorted e dal disco si
+leggono solo i blocchi con dei hit. Eviction LRU per blocco a dimensione
+limitata.
+"""
+import hashlib
+import sqlite3
+import time
+from datetime import date
+from pathlib import Path
+
+import numpy as np
+
+from imposte import REGOLE, TABELLA
+from motore import (
+    CAMPI_NUMERICI, CAMPI_RISULTATO, COLONNE_ECO, DEFAULT_IMMOBILE,
+    MOTORE_VERSIONE,
+)
+from risultati import RisultatiScenari
+
+PERCORSO_DEFAULT = Path.home() / ".cache" / "calcoli_immobile" / "risultati.sqlite"
+
+# Colonne d'ingresso che determinano il risultato, per tipo
+_INGRESSI_NUMERICI = (
+    "prezzo", "notaio", "val_catastale", "agenzia", "agenzia_iva", "under36",
+    "importo", "tasso", "durata", "pol_si", "pol_v", "istruttoria", "perizia",
+    "imp_sost",
+)
+_INGRESSI_TESTO = (
+    "imposta_tipo", "venditore", "agenzia_mode", "mutuo_mode", "pol_si_mode",
+    "pol_v_mode", "imp_sost_mode",
+)
+_PAROLE = len(_INGRESSI_NUMERICI) + len(_INGRESSI_TESTO) + 1  # + periodo
+_RIGHE_BLOCCO = 8192  # righe per blocco salvato: unità di lettura e di eviction
+# Id per query, sotto il limite di parametri SQLite (999 prima della 3.32)
+_BLOCCO_SQL = 900
+
+_M1 = np.uint64(0xBF58476D1CE4E5B9)
+_M2 = np.uint64(0x94D049BB133111EB)
+
+
+def versione_motore() -> str:
+    """Versione del motore più impronta della tabella regole fiscali."""
+    impronta = hashlib.sha256(repr(REGOLE).encode()).hexdigest()[:16]
+    return f"{MOTORE_VERSIONE}:{impronta}"
+
+
+def _mescola(x: np.ndarray) -> np.ndarray:
+    """Finalizzatore di splitmix64, biiettivo su uint64 (modifica x)."""
+    x ^= x >> np.uint64(30)
+    x *= _M1
+    x ^= x >> np.uint64(27)
+    x *= _M2
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def _codice_testo(valore) -> int:
+    """Parola a 64 bit stabile per un valore testo."""
+    return int.from_bytes(hashlib.blake2b(str(valore).encode(), digest_size=8).digest(),
+                          "little")
+
+
+class CacheRisultati:
+    """Cache LRU su SQLite, limitata a `max_byte` di blocchi salvati."""
+
+    def __init__(self, percorso=PERCORSO_DEFAULT, max_byte: int = 256 * 2**20):
+        percorso = Path(percorso)
+        percorso.parent.mkdir(parents=True, exist_ok=True)
+        self.max_byte = max_byte
+        self.hit = 0
+        self.miss = 0
+        # Un seme per lane dell'impronta e per parola della forma canonica
+        seme = hashlib.sha256(versione_motore().encode()).digest()
+        self._semi = np.random.default_rng(np.frombuffer(seme, np.uint32)).integers(
+            0, 2**64, size=(2, _PAROLE), dtype=np.uint64)
+        self._db = sqlite3.connect(percorso)
+        self._db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            -- formato per riga delle versioni precedenti
+            DROP TABLE IF EXISTS risultati;
+            CREATE TABLE IF NOT EXISTS blocchi (
+                id      INTEGER PRIMARY KEY,
+                chiavi  BLOB NOT NULL,     -- impronte, righe × 2 uint64
+                valori  BLOB NOT NULL,     -- righe × CAMPI_NUMERICI float64
+                accesso INTEGER NOT NULL
+            );
+        """)
+        self._carica_indice()
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ── Chiavi ────────────────────────────────────────────────────────────
+    def chiavi(self, c: dict) -> np.ndarray:
+        """Impronte (N, 2) uint64 delle righe, dalla forma canonica degli ingressi."""
+        n = _righe(c)
+        parole = np.empty((n, _PAROLE), dtype=np.uint64)
+        numeri = parole[:, :len(_INGRESSI_NUMERICI)].view(np.float64)
+        for j, k in enumerate(_INGRESSI_NUMERICI):
+            numeri[:, j] = np.asarray(_colonna(c, k), dtype=float)
+        numeri += 0.0  # -0.0 -> 0.0
+        for j, k in enumerate(_INGRESSI_TESTO, len(_INGRESSI_NUMERICI)):
+            # Un codice per valore distinto: poche scelte, nessun lavoro per riga
+            testo = np.asarray(_colonna(c, k))
+            if testo.ndim == 0:
+                parole[:, j] = _codice_testo(testo.item())
+                continue
+            for valore in dict.fromkeys(testo.tolist()):
+                parole[testo == valore, j] = _codice_testo(valore)
+        # Conta solo il periodo fiscale: date diverse con le stesse regole
+        # (es. il default "oggi" da un giorno all'altro) hanno la stessa chiave
+        data = _colonna(c, "data")
+        data = np.asarray(date.today() if data is None else data, dtype="datetime64[D]")
+        parole[:, -1] = np.searchsorted(TABELLA.confini, data, side="right") - 1
+
+        # Per lane, somma delle parole mescolate col seme della loro posizione:
+        # la mescola è biiettiva, due righe diverse in una parola non collidono
+        impronte = np.empty((n, 2), dtype=np.uint64)
+        for lane, semi in enumerate(self._semi):
+            impronte[:, lane] = _mescola(parole + semi).sum(axis=1, dtype=np.uint64)
+        return impronte
+
+    # ── Indice in memoria ─────────────────────────────────────────────────
+    def _carica_indice(self):
+        """Impronte di tutti i blocchi, ordinate sulla prima lane."""
+        chiavi, blocchi, righe = [np.empty((0, 2), np.uint64)], [], []
+        self._byte = 0
+        for id_, blob, byte in self._db.execute(
+                "SELECT id, chiavi, LENGTH(chiavi) + LENGTH(valori) FROM blocchi"):
+            k = np.frombuffer(blob, dtype="<u8").reshape(-1, 2)
+            chiavi.append(k)
+            blocchi.append(np.full(len(k), id_, dtype=np.int64))
+            righe.append(np.arange(len(k), dtype=np.int64))
+            self._byte += byte
+        self._indice(np.concatenate(chiavi),
+                     np.concatenate(blocchi or [np.empty(0, np.int64)]),
+                     np.concatenate(righe or [np.empty(0, np.int64)]))
+
+    def _indice(self, chiavi, blocchi, righe):
+        ordine = np.argsort(chiavi[:, 0], kind="stable")
+        self._k0, self._k1 = chiavi[ordine, 0], chiavi[ordine, 1]
+        self._blocchi, self._righe = blocchi[ordine], righe[ordine]
+
+    def _aggiungi_indice(self, id_: int, chiavi: np.ndarray):
+        ordine = np.argsort(chiavi[:, 0], kind="stable")
+        pos = np.searchsorted(self._k0, chiavi[ordine, 0])
+        self._k0 = np.insert(self._k0, pos, chiavi[ordine, 0])
+        self._k1 = np.insert(self._k1, pos, chiavi[ordine, 1])
+        self._blocchi = np.insert(self._blocchi, pos, id_)
+        self._righe = np.insert(self._righe, pos, ordine)
+
+    # ── Lettura / scrittura ───────────────────────────────────────────────
+    def leggi(self, chiavi: np.ndarray, valori: np.ndarray) -> np.ndarray:
+        """Copia in `valori` le righe note; restituisce la maschera dei hit."""
+        noti = np.zeros(len(chiavi), dtype=bool)
+        if not len(self._k0) or not len(chiavi):
+            return noti
+        pos = np.searchsorted(self._k0, chiavi[:, 0]).clip(max=len(self._k0) - 1)
+        trovati = (self._k0[pos] == chiavi[:, 0]) & (self._k1[pos] == chiavi[:, 1])
+        dove = np.flatnonzero(trovati)
+        pos = pos[dove]
+        # Hit raggruppati per blocco: ogni blob si legge una volta sola
+        ordine = np.argsort(self._blocchi[pos], kind="stable")
+        ids, inizi = np.unique(self._blocchi[pos][ordine], return_index=True)
+        gruppi = dict(zip(ids.tolist(), np.split(ordine, inizi[1:])))
+        ids = ids.tolist()
+        for i in range(0, len(ids), _BLOCCO_SQL):
+            blocco = ids[i:i + _BLOCCO_SQL]
+            for id_, blob in self._db.execute(
+                    "SELECT id, valori FROM blocchi WHERE id IN "
+                    f"({','.join('?' * len(blocco))})", blocco):
+                sel = gruppi[id_]
+                matrice = np.frombuffer(blob, dtype="<f8").reshape(-1, len(CAMPI_NUMERICI))
+                valori[dove[sel]] = matrice[self._righe[pos[sel]]]
+                noti[dove[sel]] = True
+            # Un solo UPDATE per gruppo di blocchi per l'ordine LRU
+            self._db.execute(
+                "UPDATE blocchi SET accesso = ? WHERE id IN "
+                f"({','.join('?' * len(blocco))})", (time.time_ns(), *blocco))
+        if ids:
+            self._db.commit()
+        return noti
+
+    def scrivi(self, chiavi: np.ndarray, valori: np.ndarray):
+        """Salva le righe (impronte e campi numerici) in blocchi nuovi."""
+        adesso = time.time_ns()
+        for a in range(0, len(chiavi), _RIGHE_BLOCCO):
+            k = np.ascontiguousarray(chiavi[a:a + _RIGHE_BLOCCO], dtype="<u8")
+            v = np.ascontiguousarray(valori[a:a + _RIGHE_BLOCCO], dtype="<f8")
+            id_ = self._db.execute(
+                "INSERT INTO blocchi (chiavi, valori, accesso) VALUES (?, ?, ?)",
+                (k.tobytes(), v.tobytes(), adesso)).lastrowid
+            self._aggiungi_indice(id_, k)
+            self._byte += k.nbytes + v.nbytes
+        if self._byte > self.max_byte:
+            self._sfoltisci()
+        self._db.commit()
+
+    def _sfoltisci(self):
+        """Elimina i blocchi usati meno di recente fino al 90% di max_byte."""
+        righe = self._db.execute(
+            "SELECT id, LENGTH(chiavi) + LENGTH(valori) FROM blocchi "
+            "ORDER BY accesso, id").fetchall()
+        if not righe:
+            return
+        ids, byte = (np.array(x, dtype=np.int64) for x in zip(*righe))
+        restanti = byte.sum() - np.cumsum(byte)
+        via = ids[:int(np.searchsorted(-restanti, -int(self.max_byte * 0.9))) + 1]
+        for i in range(0, len(via), _BLOCCO_SQL):
+            blocco = via[i:i + _BLOCCO_SQL].tolist()
+            self._db.execute(
+                f"DELETE FROM blocchi WHERE id IN ({','.join('?' * len(blocco))})",
+                blocco)
+        tieni = ~np.isin(self._blocchi, via)
+        self._k0, self._k1 = self._k0[tieni], self._k1[tieni]
+        self._blocchi, self._righe = self._blocchi[tieni], self._righe[tieni]
+        self._byte = int(byte.sum() - byte[:len(via)].sum())
+
+    # ── Calcolo con cache ─────────────────────────────────────────────────
+    def calcola(self, c: dict, funzione) -> RisultatiScenari:
+        """
+        Risultati di `funzione(c)` (un calcolo vettoriale per righe), leggendo
+        da disco le righe già note e calcolando solo le mancanti.
+        """
+        n = _righe(c)
+        chiavi = self.chiavi(c)
+        # Ordine Fortran: ogni campo è una colonna contigua
+        valori = np.empty((n, len(CAMPI_NUMERICI)), order="F")
+        noti = self.leggi(chiavi, valori)
+        n_noti = int(noti.sum())
+        self.hit += n_noti
+        self.miss += n - n_noti
+
+        if n_noti < n:
+            mancanti = np.flatnonzero(~noti)
+            sub = {k: (np.asarray(v)[mancanti] if np.ndim(v) else v)
+                   for k, v in c.items()}
+            ris = funzione(sub)
+            nuovi = np.empty((len(mancanti), len(CAMPI_NUMERICI)))
+            for j, k in enumerate(CAMPI_NUMERICI):
+                nuovi[:, j] = ris[k]
+            valori[mancanti] = nuovi
+            self.scrivi(chiavi[mancanti], nuovi)
+
+        colonne = {k: valori[:, j] for j, k in enumerate(CAMPI_NUMERICI)}
+        for k, origine in COLONNE_ECO.items():
+            colonne[k] = np.broadcast_to(np.asarray(_colonna(c, origine)), (n,))
+        return RisultatiScenari({k: colonne[k] for k in CAMPI_RISULTATO}, n)
+
+    def statistiche(self) -> dict:
+        totale = self.hit + self.miss
+        return {
+            "hit":      self.hit,
+            "miss":     self.miss,
+            "hit_rate": self.hit / totale if totale else 0.0,
+            "voci":     len(self._k0),
+            "byte":     self._byte,
+        }
+
+
+def _colonna(c: dict, k: str):
+    if k in c:
+        return c[k]
+    if k in DEFAULT_IMMOBILE:
+        return DEFAULT_IMMOBILE[k]
+    return ""  # etichette assenti
+
+
+def _righe(c: dict) -> int:
+    return max((len(v) for v in c.values() if np.ndim(v)), default=1)
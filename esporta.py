@@ -0,0 +1,339 @@
+"""
+Esportazione dei risultati in fogli di calcolo XLSX o ODS, in streaming.
+
+Il file è scritto con zipfile e XML composto a mano, una parte alla volta:
+le righe vengono formattate a blocchi, colonna per colonna, e scritte subito
+nel flusso compresso. La memoria usata dipende dal blocco, non dal numero di
+scenari né dalla lunghezza dei piani di ammortamento.
+
+Il primo foglio ("Confronto") ha una riga per scenario con tutti i campi di
+calcola_righe; con i piani, ogni scenario ha un foglio con il piano di
+ammortamento mese per mese.
+"""
+import zipfile
+from pathlib import Path
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+from motore import piano_ammortamento
+from risultati import RisultatiScenari
+
+FORMATI = (".xlsx", ".ods")
+CAMPI_PIANO = ("Mese", "Rata", "Quota interessi", "Quota capitale",
+               "Debito residuo")
+
+_BLOCCO_RIGHE = 4096    # righe formattate insieme
+_BLOCCO_PIANI = 64      # scenari per passata di piano_ammortamento
+_MAX_RIGHE = 1_048_576  # righe per foglio in Excel e LibreOffice
+_MAX_NOME = 31          # caratteri nel nome di un foglio (Excel)
+
+
+# ── Celle ─────────────────────────────────────────────────────────────────────
+def _celle(v: np.ndarray, modelli: dict) -> list[str]:
+    """XML delle celle di una colonna, formattato in blocco."""
+    n = len(v)
+    if n > 1 and v.strides == (0,):  # colonna costante: una cella ripetuta
+        return _celle(v[:1], modelli) * n
+    if v.dtype.kind in "USO":
+        distinti, codici = np.unique(v.astype(str), return_inverse=True)
+        celle = [modelli["testo"].format(escape(x)) for x in distinti.tolist()]
+        return np.array(celle, dtype=object)[codici].tolist()
+    if v.dtype.kind == "b":
+        return [modelli["vero"] if x else modelli["falso"] for x in v.tolist()]
+    if v.dtype.kind not in "iu":
+        v = v.astype(float)
+    celle = ((modelli["numero"] + "\n") * n).format(*v.tolist()).split("\n")[:-1]
+    for i in np.flatnonzero(~np.isfinite(v)).tolist():  # NaN: cella vuota
+        celle[i] = modelli["vuota"]
+    return celle
+
+
+def _nome_foglio(nome: str, usati: set) -> str:
+    """Nome valido e unico: senza []:*?/\\ e al massimo _MAX_NOME caratteri."""
+    nome = "".join("_" if ch in "[]:*?/\\" else ch for ch in nome).strip("' ")
+    nome = nome[:_MAX_NOME] or "Foglio"
+    base, i = nome, 2
+    while nome.lower() in usati:
+        suffisso = f" ({i})"
+        nome, i = base[:_MAX_NOME - len(suffisso)] + suffisso, i + 1
+    usati.add(nome.lower())
+    return nome
+
+
+# ── Formati ───────────────────────────────────────────────────────────────────
+_NS_XLSX = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG = "http://schemas.openxmlformats.org/package/2006/relationships"
+_CT_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml"
+_STILI_XLSX = f"""<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="{_NS_XLSX}">
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/><xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>
+</styleSheet>"""
+
+
+class _Xlsx:
+    """SpreadsheetML: un file XML per foglio, indice scritto in chiusura."""
+    riga = ("<row>", "</row>")
+    modelli = {
+        "numero": "<c><v>{!r}</v></c>",
+        "testo":  '<c t="inlineStr"><is><t xml:space="preserve">{}</t></is></c>',
+        "vero":   '<c t="b"><v>1</v></c>',
+        "falso":  '<c t="b"><v>0</v></c>',
+        "vuota":  "<c/>",
+    }
+    intestazione = '<c t="inlineStr" s="1"><is><t xml:space="preserve">{}</t></is></c>'
+
+    def __init__(self, zf: zipfile.ZipFile):
+        self._zf = zf
+        self._fogli = []
+        self.flusso = None
+
+    def apri_foglio(self, nome: str):
+        self._fogli.append(nome)
+        self.flusso = self._zf.open(
+            f"xl/worksheets/sheet{len(self._fogli)}.xml", "w", force_zip64=True)
+        self.flusso.write(
+            f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            f'<worksheet xmlns="{_NS_XLSX}"><sheetViews><sheetView workbookViewId="0">'
+            f'<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+            f'</sheetView></sheetViews><sheetData>'.encode())
+
+    def scrivi(self, testo: str):
+        self.flusso.write(testo.encode())
+
+    def chiudi_foglio(self):
+        self.flusso.write(b"</sheetData></worksheet>")
+        self.flusso.close()
+        self.flusso = None
+
+    def chiudi(self):
+        n = len(self._fogli)
+        fogli = "".join(
+            f'<sheet name={quoteattr(nome)} sheetId="{i}" r:id="rId{i}"/>'
+            for i, nome in enumerate(self._fogli, 1))
+        relazioni = "".join(
+            f'<Relationship Id="rId{i}" Type="{_NS_REL}/worksheet" '
+            f'Target="worksheets/sheet{i}.xml"/>' for i in range(1, n + 1))
+        tipi = "".join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            f'ContentType="{_CT_XLSX}.worksheet+xml"/>' for i in range(1, n + 1))
+        intestazione = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        self._zf.writestr("xl/workbook.xml", (
+            f'{intestazione}<workbook xmlns="{_NS_XLSX}" xmlns:r="{_NS_REL}">'
+            f'<sheets>{fogli}</sheets></workbook>'))
+        self._zf.writestr("xl/_rels/workbook.xml.rels", (
+            f'{intestazione}<Relationships xmlns="{_NS_PKG}">{relazioni}'
+            f'<Relationship Id="rId{n + 1}" Type="{_NS_REL}/styles" '
+            f'Target="styles.xml"/></Relationships>'))
+        self._zf.writestr("xl/styles.xml", _STILI_XLSX)
+        self._zf.writestr("_rels/.rels", (
+            f'{intestazione}<Relationships xmlns="{_NS_PKG}">'
+            f'<Relationship Id="rId1" Type="{_NS_REL}/officeDocument" '
+            f'Target="xl/workbook.xml"/></Relationships>'))
+        self._zf.writestr("[Content_Types].xml", (
+            f'{intestazione}<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            f'<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            f'<Default Extension="xml" ContentType="application/xml"/>'
+            f'<Override PartName="/xl/workbook.xml" ContentType="{_CT_XLSX}.sheet.main+xml"/>'
+            f'<Override PartName="/xl/styles.xml" ContentType="{_CT_XLSX}.styles+xml"/>'
+            f'{tipi}</Types>'))
+
+
+_MIME_ODS = "application/vnd.oasis.opendocument.spreadsheet"
+_NS_ODS = ('xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0" '
+           'xmlns:table="urn:oasis:names:tc:opendocument:xmlns:table:1.0" '
+           'xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0" '
+           'xmlns:style="urn:oasis:names:tc:opendocument:xmlns:style:1.0" '
+           'xmlns:fo="urn:oasis:names:tc:opendocument:xmlns:xsl-fo-compatible:1.0"')
+
+
+class _Ods:
+    """OpenDocument: tutti i fogli in un unico content.xml, scritto in flusso."""
+    riga = ("<table:table-row>", "</table:table-row>")
+    modelli = {
+        "numero": '<table:table-cell office:value-type="float" office:value="{!r}"/>',
+        "testo":  ('<table:table-cell office:value-type="string">'
+                   '<text:p>{}</text:p></table:table-cell>'),
+        "vero":   ('<table:table-cell office:value-type="boolean" '
+                   'office:boolean-value="true"/>'),
+        "falso":  ('<table:table-cell office:value-type="boolean" '
+                   'office:boolean-value="false"/>'),
+        "vuota":  "<table:table-cell/>",
+    }
+    intestazione = ('<table:table-cell table:style-name="intestazione" '
+                    'office:value-type="string"><text:p>{}</text:p></table:table-cell>')
+
+    def __init__(self, zf: zipfile.ZipFile):
+        self._zf = zf
+        # mimetype per primo e non compresso, come richiede il formato
+        zf.writestr(zipfile.ZipInfo("mimetype"), _MIME_ODS)
+        self.flusso = zf.open("content.xml", "w", force_zip64=True)
+        self.flusso.write(
+            f'<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<office:document-content {_NS_ODS} office:version="1.2">'
+            f'<office:automatic-styles><style:style style:name="intestazione" '
+            f'style:family="table-cell"><style:text-properties fo:font-weight="bold"/>'
+            f'</style:style></office:automatic-styles>'
+            f'<office:body><office:spreadsheet>'.encode())
+
+    def apri_foglio(self, nome: str):
+        self.flusso.write(f"<table:table table:name={quoteattr(nome)}>".encode())
+
+    def scrivi(self, testo: str):
+        self.flusso.write(testo.encode())
+
+    def chiudi_foglio(self):
+        self.flusso.write(b"</table:table>")
+
+    def chiudi(self):
+        self.flusso.write(b"</office:spreadsheet></office:body></office:document-content>")
+        self.flusso.close()
+        self.flusso = None
+        self._zf.writestr("META-INF/manifest.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" '
+            'manifest:version="1.2">'
+            f'<manifest:file-entry manifest:full-path="/" manifest:media-type="{_MIME_ODS}"/>'
+            '<manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/>'
+            '</manifest:manifest>'))
+
+
+# ── Esportazione ──────────────────────────────────────────────────────────────
+class Esportazione:
+    """
+    Cartella di lavoro scritta un foglio alla volta; il formato segue
+    l'estensione del percorso (.xlsx o .ods). Va chiusa (o usata con `with`)
+    perché il file sia valido.
+    """
+
+    def __init__(self, percorso):
+        formato = Path(percorso).suffix.lower()
+        if formato not in FORMATI:
+            raise ValueError(f"Formato {formato or 'mancante'!r} non supportato: "
+                             f"usare {' o '.join(FORMATI)}")
+        self._percorso = Path(percorso)
+        self._zf = zipfile.ZipFile(percorso, "w", zipfile.ZIP_DEFLATED,
+                                   compresslevel=1)
+        self._formato = _Xlsx(self._zf) if formato == ".xlsx" else _Ods(self._zf)
+        self._nomi = set()
+        self.righe = 0
+
+    def close(self):
+        if self._zf.fp is not None:
+            self._formato.chiudi()
+            self._zf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, *exc):
+        if tipo is None:
+            self.close()
+            return
+        # Errore a metà scrittura: niente file incompleto
+        if self._formato.flusso is not None:
+            self._formato.flusso.close()
+        self._zf.close()
+        self._percorso.unlink(missing_ok=True)
+
+    def foglio(self, nome: str, intestazione, blocchi):
+        """
+        Un foglio con la riga d'intestazione e i blocchi di righe, ciascuno
+        una lista di colonne (array della stessa lunghezza). Oltre _MAX_RIGHE
+        righe continua su fogli "nome (2)", "nome (3)"...
+        """
+        f = self._formato
+        testata = f.riga[0] + "".join(
+            f.intestazione.format(escape(str(x))) for x in intestazione) + f.riga[1]
+        libere = 0  # righe ancora disponibili nel foglio aperto
+        aperto = False
+        for colonne in blocchi:
+            colonne = [np.asarray(c) for c in colonne]
+            a, n = 0, len(colonne[0])
+            while a < n:
+                if not libere:
+                    if aperto:
+                        f.chiudi_foglio()
+                    f.apri_foglio(_nome_foglio(nome, self._nomi))
+                    f.scrivi(testata)
+                    libere, aperto = _MAX_RIGHE - 1, True
+                z = min(n, a + libere)
+                celle = [_celle(c[a:z], f.modelli) for c in colonne]
+                f.scrivi("".join([f.riga[0] + "".join(r) + f.riga[1]
+                                  for r in zip(*celle)]))
+                self.righe += z - a
+                libere -= z - a
+                a = z
+        if not aperto:  # nessuna riga: solo l'intestazione
+            f.apri_foglio(_nome_foglio(nome, self._nomi))
+            f.scrivi(testata)
+        f.chiudi_foglio()
+
+    def risultati(self, ris, nome: str = "Confronto"):
+        """
+        Foglio di confronto, una riga per scenario con tutti i campi. `ris` è
+        un RisultatiScenari o un iterabile di RisultatiScenari con gli stessi
+        campi (per esempio i blocchi di un calcolo batch).
+        """
+        if isinstance(ris, RisultatiScenari):
+            ris = [ris]
+        ris = iter(ris)
+        primo = next(ris, None)
+        if primo is None:
+            return self.foglio(nome, (), [])
+
+        def blocchi():
+            for r in (primo, *ris):
+                for a in range(0, len(r), _BLOCCO_RIGHE):
+                    parte = r[a:a + _BLOCCO_RIGHE]
+                    yield [parte[k] for k in primo.campi]
+
+        self.foglio(nome, primo.campi, blocchi())
+
+    def piani(self, importo, tasso_ann, durata_ann, nomi):
+        """
+        Un foglio per scenario con il piano di ammortamento mese per mese.
+        `tasso_ann` in percentuale e `durata_ann` in anni, come nei risultati.
+        """
+        importo = np.asarray(importo, dtype=float)
+        tasso = np.asarray(tasso_ann, dtype=float) / 100
+        n_mesi = np.floor(np.asarray(durata_ann, dtype=float) * 12)
+        n_mesi = np.where(np.isfinite(n_mesi), np.maximum(n_mesi, 0), 0).astype(int)
+        nomi = list(nomi)
+        for a in range(0, len(importo), _BLOCCO_PIANI):
+            z = min(a + _BLOCCO_PIANI, len(importo))
+            mesi = int(n_mesi[a:z].max())
+            debito, interessi = piano_ammortamento(
+                importo[a:z], tasso[a:z], n_mesi[a:z], mesi)
+            for i in range(a, z):
+                n, d, c = n_mesi[i], debito[i - a], interessi[i - a]
+                quota_int = np.diff(c[:n + 1])
+                quota_cap = -np.diff(d[:n + 1])
+                self.foglio(nomi[i], CAMPI_PIANO, [[
+                    np.arange(1, n + 1), quota_int + quota_cap,
+                    quota_int, quota_cap, d[1:n + 1],
+                ]])
+
+
+def nomi_piani(ris, primo: int = 1) -> list[str]:
+    """Nomi dei fogli piano: numero di riga nel confronto ed etichetta."""
+    return [f"{i} {etichetta}"
+            for i, etichetta in enumerate(ris["label"].tolist(), primo)]
+
+
+def esporta(percorso, ris: RisultatiScenari, piani: bool = False) -> int:
+    """
+    Confronto degli scenari e, con `piani`, un piano di ammortamento per
+    scenario, nel formato indicato dall'estensione. Ritorna le righe scritte.
+    """
+    with Esportazione(percorso) as e:
+        e.risultati(ris)
+        if piani:
+            e.piani(ris["importo"], ris["tasso_ann"], ris["durata_ann"],
+                    nomi_piani(ris))
+    return e.righe
@@ -0,0 +1,215 @@
+"""
+Grafici degli scenari: debito residuo, interessi cumulati, rata vs tasso.
+
+Le serie arrivano dal motore vettoriale e vengono ridotte a risoluzione
+pixel prima del disegno, sia sul tk.Canvas dell'app sia nel PDF (ReportLab).
+"""
+import math
+import tkinter as tk
+
+import numpy as np
+from reportlab.graphics.shapes import Drawing, Line, PolyLine, String
+from reportlab.lib import colors
+
+from motore import curva_rata_tasso, piano_ammortamento, riduci_a_pixel
+
+VISTE = ("Debito residuo", "Interessi cumulati", "Rata vs tasso")
+
+
+# ── Serie ─────────────────────────────────────────────────────────────────────
+def calcola_serie(vista: str, importi, tassi, n_mesi):
+    """
+    Serie per la vista richiesta, tutti gli scenari in un'unica passata.
+    `tassi` come frazione, `n_mesi` in mesi.
+    Ritorna (x, Y, etichetta asse x) con Y di forma (scenari × punti).
+    """
+    importi = np.atleast_1d(np.asarray(importi, dtype=float))
+    tassi   = np.atleast_1d(np.asarray(tassi, dtype=float))
+    n_mesi  = np.atleast_1d(np.asarray(n_mesi, dtype=float))
+    if vista == "Rata vs tasso":
+        t_max = max(0.08, float(tassi.max(initial=0.0)) * 1.5)
+        x = np.linspace(t_max / 160, t_max, 160)
+        return x * 100, curva_rata_tasso(importi, n_mesi, x), "Tasso annuo (%)"
+
+    mesi = int(max(n_mesi.max(initial=0.0), 12))
+    debito, interessi = piano_ammortamento(importi, tassi, n_mesi, mesi)
+    Y = debito if vista == "Debito residuo" else interessi
+    return np.arange(mesi + 1) / 12, Y, "Anni"
+
+
+# ── Assi ──────────────────────────────────────────────────────────────────────
+def _tacche(lo: float, hi: float, n: int = 5):
+    """Intervallo arrotondato e tacche 'tonde' (1, 2, 2.5, 5 × 10^k)."""
+    if not hi > lo:
+        hi = lo + 1.0
+    grezzo = (hi - lo) / n
+    mag = 10 ** math.floor(math.log10(grezzo))
+    passo = next(m * mag for m in (1, 2, 2.5, 5, 10) if grezzo <= m * mag)
+    inizio = math.floor(lo / passo) * passo
+    fine = math.ceil(hi / passo) * passo
+    return inizio, fine, np.arange(inizio, fine + passo / 2, passo)
+
+
+def _fmt_asse_eur(v: float) -> str:
+    if abs(v) >= 1000:
+        return f"€ {v / 1000:.0f}k"
+    return f"€ {v:.0f}"
+
+
+def _fmt_asse_x(v: float) -> str:
+    return f"{v:g}"
+
+
+def _limiti(x: np.ndarray, Y: np.ndarray):
+    x0, x1, tx = _tacche(float(x.min()), float(x.max()))
+    y0, y1, ty = _tacche(min(0.0, float(np.nanmin(Y))), float(np.nanmax(Y)))
+    return x0, x1, tx, y0, y1, ty
+
+
+# ── Canvas Tk ─────────────────────────────────────────────────────────────────
+class GraficoCanvas(tk.Canvas):
+    """
+    Grafico a linee con ridisegno incrementale: assi, linee e legenda
+    vengono toccati solo se la loro geometria (in pixel) cambia.
+    """
+
+    MARGINI = (64, 12, 130, 28)  # sinistra, alto, destra (legenda), basso
+
+    def __init__(self, parent, width: int = 660, height: int = 260, **kw):
+        kw.setdefault("bg", "#2b2b2b")
+        super().__init__(parent, width=width, height=height,
+                         highlightthickness=0, **kw)
+        self._w, self._h = width, height
+        self._linee: dict[int, tuple] = {}    # i -> (id, coordinate, colore)
+        self._legenda: dict[int, tuple] = {}  # i -> (id, testo, colore)
+        self._assi = None
+
+    def aggiorna(self, x, Y, colori: list[str], etichette: list[str],
+                 etichetta_x: str):
+        sx, alto, dx, basso = self.MARGINI
+        area_w = self._w - sx - dx
+        area_h = self._h - alto - basso
+        x, Y = riduci_a_pixel(np.asarray(x, dtype=float),
+                              np.asarray(Y, dtype=float), area_w)
+
+        x0, x1, tx, y0, y1, ty = _limiti(x, Y)
+        assi = (x0, x1, y0, y1, etichetta_x)
+        if assi != self._assi:
+            self._disegna_assi(x0, x1, tx, y0, y1, ty, etichetta_x)
+            self._assi = assi
+
+        punti = np.empty((Y.shape[0], 2 * x.size))
+        punti[:, 0::2] = sx + (x - x0) / (x1 - x0) * area_w
+        punti[:, 1::2] = alto + (y1 - Y) / (y1 - y0) * area_h
+        punti = np.rint(punti).astype(int)
+
+        for i, (p, colore) in enumerate(zip(punti, colori)):
+            coords = tuple(p.tolist())
+            voce = self._linee.get(i)
+            if voce is None:
+                item = self.create_line(*coords, fill=colore, width=2,
+                                        tags="serie")
+            else:
+                item, vecchie, vecchio_col = voce
+                if coords != vecchie:
+                    self.coords(item, *coords)
+                if colore != vecchio_col:
+                    self.itemconfigure(item, fill=colore)
+            self._linee[i] = (item, coords, colore)
+            self._aggiorna_legenda(i, etichette[i], colore)
+
+        for i in [k for k in self._linee if k >= len(punti)]:
+            self.delete(self._linee.pop(i)[0])
+            self.delete(self._legenda.pop(i)[0])
+
+    def _aggiorna_legenda(self, i: int, testo: str, colore: str):
+        testo = testo if len(testo) <= 18 else testo[:17] + "…"
+        voce = self._legenda.get(i)
+        if voce is None:
+            item = self.create_text(
+                self._w - self.MARGINI[2] + 10, self.MARGINI[1] + 6 + 12 * i,
+                text=testo, fill=colore, anchor="w", font=("Helvetica", 9),
+            )
+        else:
+            item, vecchio, vecchio_col = voce
+            if (testo, colore) != (vecchio, vecchio_col):
+                self.itemconfigure(item, text=testo, fill=colore)
+        self._legenda[i] = (item, testo, colore)
+
+    def _disegna_assi(self, x0, x1, tx, y0, y1, ty, etichetta_x):
+        sx, alto, dx, basso = self.MARGINI
+        area_w = self._w - sx - dx
+        area_h = self._h - alto - basso
+        self.delete("assi")
+        griglia, testo = "#444444", "#aaaaaa"
+        for v in ty:
+            y = alto + (y1 - v) / (y1 - y0) * area_h
+            self.create_line(sx, y, sx + area_w, y, fill=griglia, tags="assi")
+            self.create_text(sx - 6, y, text=_fmt_asse_eur(v), fill=testo,
+                             anchor="e", font=("Helvetica", 8), tags="assi")
+        for v in tx:
+            x = sx + (v - x0) / (x1 - x0) * area_w
+            self.create_line(x, alto, x, alto + area_h, fill=griglia,
+                             tags="assi")
+            self.create_text(x, alto + area_h + 4, text=_fmt_asse_x(v),
+                             fill=testo, anchor="n", font=("Helvetica", 8),
+                             tags="assi")
+        self.create_text(sx + area_w, self._h - 2, text=etichetta_x,
+                         fill=testo, anchor="se", font=("Helvetica", 8),
+                         tags="assi")
+        self.tag_lower("assi")
+
+
+# ── ReportLab ─────────────────────────────────────────────────────────────────
+def disegno_pdf(x, Y, colori: list[str], etichette: list[str],
+                etichetta_x: str, titolo: str,
+                larghezza: float, altezza: float) -> Drawing:
+    """Stesse serie del canvas, come Drawing da inserire nella story del PDF."""
+    sx, alto, dx, basso = 48, 16, 100, 24
+    area_w = larghezza - sx - dx
+    area_h = altezza - alto - basso
+    x, Y = riduci_a_pixel(np.asarray(x, dtype=float),
+                          np.asarray(Y, dtype=float), int(area_w))
+    x0, x1, tx, y0, y1, ty = _limiti(x, Y)
+
+    d = Drawing(larghezza, altezza)
+    grigio = colors.HexColor("#aab7b8")
+    d.add(String(sx, altezza - 11, titolo, fontName="Helvetica-Bold",
+                 fontSize=9))
+    for v in ty:
+        y = basso + (v - y0) / (y1 - y0) * area_h
+        d.add(Line(sx, y, sx + area_w, y, strokeColor=grigio,
+                   strokeWidth=0.3))
+        d.add(String(sx - 4, y - 3, _fmt_asse_eur(v), fontSize=6,
+                     textAnchor="end"))
+    for v in tx:
+        xp = sx + (v - x0) / (x1 - x0) * area_w
+        d.add(Line(xp, basso, xp, basso + area_h, strokeColor=grigio,
+                   strokeWidth=0.3))
+        d.add(String(xp, basso - 9, _fmt_asse_x(v), fontSize=6,
+                     textAnchor="middle"))
+    d.add(String(sx + area_w, 2, etichetta_x, fontSize=6, textAnchor="end"))
+
+    # Legenda nell'altezza dell'area: due colonne se non basta una, poi
+    # righe più fitte
+    primo = altezza - alto - 8
+    per_colonna = int((primo - basso) // 9) + 1
+    colonne = 1 if len(Y) <= per_colonna else 2
+    righe = -(-len(Y) // colonne)
+    passo = min(9.0, (primo - basso) / max(righe - 1, 1))
+    corpo = min(6.0, passo * 0.8)
+    larghezza_col = (dx - 8) / colonne
+    caratteri = 20 if colonne == 1 else 10
+
+    px = sx + (x - x0) / (x1 - x0) * area_w
+    for i, (riga, colore) in enumerate(zip(Y, colori)):
+        py = basso + (riga - y0) / (y1 - y0) * area_h
+        punti = np.empty(2 * px.size)
+        punti[0::2], punti[1::2] = px, py
+        d.add(PolyLine(punti.tolist(), strokeColor=colors.HexColor(colore),
+                       strokeWidth=1.2))
+        c, r = divmod(i, righe)
+        d.add(String(sx + area_w + 8 + c * larghezza_col, primo - passo * r,
+                     etichette[i][:caratteri], fontSize=corpo,
+                     fillColor=colors.HexColor(colore)))
+    return d
@@ -0,0 +1,190 @@
+"""
+Regole fiscali d'acquisto come tabella dati.
+
+Ogni regola vale per una combinazione (venditore, tipo immobile, acquirente
+under 36) in un intervallo di date. La tabella viene compilata una volta in
+array densi indicizzati per [periodo, venditore, tipo, under36], così il
+calcolo su N righe è una lookup vettoriale senza rami per riga.
+Per aggiornare le aliquote basta modificare REGOLE.
+"""
+from datetime import date
+
+import numpy as np
+
+VENDITORI = ("Privato", "Costruttore")
+TIPI      = ("Prima casa", "Seconda casa", "Lusso")  # Lusso: cat. A/1, A/8, A/9
+
+# Campi numerici di ogni regola (aliquote come frazione, importi in €):
+#   registro_pct   aliquota registro sul valore catastale (prezzo-valore)
+#   registro_min   minimo dell'imposta di registro proporzionale
+#   registro_fisso registro in misura fissa (acquisto soggetto a IVA)
+#   ipotecaria, catastale  imposte fisse
+#   iva_pct        IVA sul prezzo (solo da costruttore)
+#   credito_iva    quota dell'IVA restituita come credito d'imposta
+#   sost_pct       imposta sostitutiva sul mutuo
+#   iva_agenzia    IVA sulla provvigione dell'agenzia
+CAMPI = (
+    "registro_pct", "registro_min", "registro_fisso", "ipotecaria",
+    "catastale", "iva_pct", "credito_iva", "sost_pct", "iva_agenzia",
+)
+
+_PRIVATO = dict(registro_min=1000.0, registro_fisso=0.0, ipotecaria=50.0,
+                catastale=50.0, iva_pct=0.0, credito_iva=0.0, iva_agenzia=0.22)
+_COSTRUTTORE = dict(registro_pct=0.0, registro_min=0.0, registro_fisso=200.0,
+                    ipotecaria=200.0, catastale=200.0, credito_iva=0.0,
+                    iva_agenzia=0.22)
+_UNDER36 = (date(2021, 5, 26), date(2024, 12, 31))  # D.L. 73/2021 e proroghe
+
+# under36=None vale per entrambi; una regola specifica (True/False) prevale.
+REGOLE = (
+    # ── Acquisto da privato (dal 2014: minimo registro € 1.000) ──────────
+    dict(venditore="Privato", tipo="Prima casa", under36=None,
+         dal=date(2014, 1, 1), al=None,
+         registro_pct=0.02, sost_pct=0.0025, **_PRIVATO),
+    dict(venditore="Privato", tipo="Seconda casa", under36=None,
+         dal=date(2014, 1, 1), al=None,
+         registro_pct=0.09, sost_pct=0.02, **_PRIVATO),
+    dict(venditore="Privato", tipo="Lusso", under36=None,
+         dal=date(2014, 1, 1), al=None,
+         registro_pct=0.09, sost_pct=0.02, **_PRIVATO),
+    dict(venditore="Privato", tipo="Prima casa", under36=True,
+         dal=_UNDER36[0], al=_UNDER36[1],
+         registro_pct=0.0, registro_min=0.0, registro_fisso=0.0,
+         ipotecaria=0.0, catastale=0.0, iva_pct=0.0, credito_iva=0.0,
+         sost_pct=0.0, iva_agenzia=0.22),
+    # ── Acquisto da costruttore (IVA, imposte in misura fissa) ───────────
+    dict(venditore="Costruttore", tipo="Prima casa", under36=None,
+         dal=date(2014, 1, 1), al=None,
+         iva_pct=0.04, sost_pct=0.0025, **_COSTRUTTORE),
+    dict(venditore="Costruttore", tipo="Seconda casa", under36=None,
+         dal=date(2014, 1, 1), al=None,
+         iva_pct=0.10, sost_pct=0.02, **_COSTRUTTORE),
+    dict(venditore="Costruttore", tipo="Lusso", under36=None,
+         dal=date(2014, 1, 1), al=None,
+         iva_pct=0.22, sost_pct=0.02, **_COSTRUTTORE),
+    dict(venditore="Costruttore", tipo="Prima casa", under36=True,
+         dal=_UNDER36[0], al=_UNDER36[1],
+         registro_pct=0.0, registro_min=0.0, registro_fisso=0.0,
+         ipotecaria=0.0, catastale=0.0, iva_pct=0.04, credito_iva=1.0,
+         sost_pct=0.0, iva_agenzia=0.22),
+)
+
+
+# ── Compilazione ──────────────────────────────────────────────────────────────
+class TabellaImposte:
+    """Regole compilate in array densi, valutabili su N righe per volta."""
+
+    def __init__(self, regole=REGOLE):
+        giorno = np.timedelta64(1, "D")
+        confini = {np.datetime64(r["dal"], "D") for r in regole}
+        confini |= {np.datetime64(r["al"], "D") + giorno
+                    for r in regole if r["al"] is not None}
+        self.confini = np.array(sorted(confini), dtype="datetime64[D]")
+        self.prima_data = self.confini[0].item()  # prima data coperta
+
+        forma = (len(self.confini), len(VENDITORI), len(TIPI), 2)
+        self.valida = np.zeros(forma, dtype=bool)
+        self.campi = {c: np.zeros(forma) for c in CAMPI}
+        specifica = np.zeros(forma, dtype=bool)
+        for r in regole:
+            dal = np.datetime64(r["dal"], "D")
+            al = np.datetime64(r["al"], "D") if r["al"] is not None else None
+            periodi = (self.confini >= dal) & (
+                self.confini <= al if al is not None else True)
+            v, t = VENDITORI.index(r["venditore"]), TIPI.index(r["tipo"])
+            for u in ((0, 1) if r["under36"] is None else (int(r["under36"]),)):
+                idx = np.flatnonzero(periodi & ~specifica[:, v, t, u])
+                self.valida[idx, v, t, u] = True
+                for c in CAMPI:
+                    self.campi[c][idx, v, t, u] = r[c]
+                if r["under36"] is not None:
+                    specifica[idx, v, t, u] = True
+
+    def _indici(self, venditore, tipo, under36, data):
+        venditore, tipo, under36, data = np.broadcast_arrays(
+            np.asarray(venditore), np.asarray(tipo),
+            np.asarray(under36, dtype=bool),
+            np.asarray(date.today() if data is None else data,
+                       dtype="datetime64[D]"),
+        )
+        v = _codici(venditore, VENDITORI)
+        t = _codici(tipo, TIPI)
+        p = np.searchsorted(self.confini, data, side="right") - 1
+        if (p < 0).any():
+            raise ValueError("Nessuna regola fiscale per date anteriori al "
+                             f"{self.prima_data:%d/%m/%Y}")
+        idx = (p, v, t, under36.astype(int))
+        if not self.valida[idx].all():
+            raise ValueError("Nessuna regola fiscale per la data indicata")
+        return idx
+
+    def regole(self, venditore, tipo, under36=False, data=None) -> dict:
+        """Campi della regola applicabile, come array (uno per riga)."""
+        idx = self._indici(venditore, tipo, under36, data)
+        return {c: a[idx] for c, a in self.campi.items()}
+
+    def valuta(self, prezzo, val_catastale, venditore, tipo,
+               under36=False, data=None) -> dict:
+        """Imposte d'acquisto per N righe: registro, ipotecaria, catastale, IVA."""
+        r = self.regole(venditore, tipo, under36, data)
+        val_catastale = np.asarray(val_catastale, dtype=float)
+        proporzionale = np.maximum(_arrotonda_cent(val_catastale * r["registro_pct"]),
+                                   r["registro_min"])
+        registro = np.where(r["registro_fisso"] > 0, r["registro_fisso"],
+                            np.where(r["registro_pct"] > 0, proporzionale, 0.0))
+        iva = _arrotonda_cent(np.asarray(prezzo, dtype=float) * r["iva_pct"])
+        credito = iva * r["credito_iva"]
+        ris = {
+            "pct":        r["registro_pct"],
+            "registro":   registro,
+            "ipotecaria": r["ipotecaria"],
+            "catastale":  r["catastale"],
+            "iva_pct":    r["iva_pct"],
+            "iva":        iva,
+            "credito":    credito,
+            "totale":     registro + r["ipotecaria"] + r["catastale"] + iva - credito,
+        }
+        forma = np.broadcast_shapes(*(v.shape for v in ris.values()))
+        return {k: np.broadcast_to(v, forma) for k, v in ris.items()}
+
+
+def _arrotonda_cent(x) -> np.ndarray:
+    """
+    round(x, 2) di Python su array. np.round arrotonda x*100, che su un quasi
+    mezzo centesimo può finire esattamente a metà e sbagliare di un centesimo:
+    quei pochi casi passano per round.
+    """
+    x = np.asarray(x, dtype=float)
+    cent = x * 100
+    ris = np.asarray(np.round(cent) / 100)
+    dubbi = np.abs(cent - np.floor(cent) - 0.5) < 1e-6
+    if dubbi.any():
+        ris[dubbi] = [round(v, 2) for v in x[dubbi].tolist()]
+    return ris
+
+
+def _codici(valori: np.ndarray, nomi: tuple) -> np.ndarray:
+    codici = np.full(valori.shape, -1)
+    for i, nome in enumerate(nomi):
+        codici[valori == nome] = i
+    if (codici < 0).any():
+        sconosciuti = sorted(set(valori[codici < 0].tolist()))
+        raise ValueError(f"Valori non previsti: {sconosciuti} (ammessi: {nomi})")
+    return codici
+
+
+TABELLA = TabellaImposte()
+
+
+def imposte_acquisto(prezzo, val_catastale, venditore="Privato",
+                     tipo="Prima casa", under36=False, data=None) -> dict:
+    return TABELLA.valuta(prezzo, val_catastale, venditore, tipo, under36, data)
+
+
+def aliquota_sostitutiva(tipo, under36=False, data=None):
+    """Aliquota imposta sostitutiva sul mutuo (frazione), per tipo immobile."""
+    return TABELLA.regole("Privato", tipo, under36, data)["sost_pct"]
+
+
+def aliquota_iva_agenzia(data=None) -> float:
+    return float(TABELLA.regole("Privato", "Prima casa", False, data)["iva_agenzia"])
@@ -0,0 +1,471 @@
+"""
+Motore di calcolo vettoriale (NumPy) per gli scenari mutuo.
+
+Ogni funzione lavora su array con un elemento per scenario e riproduce le
+formule di calcola_scenario: ammortamento alla francese, rata nulla se
+tasso o durata non sono positivi.
+"""
+import numpy as np
+
+from imposte import aliquota_sostitutiva, imposte_acquisto
+from risultati import RisultatiScenari
+
+# Da incrementare a ogni modifica dei calcoli: invalida la cache su disco.
+MOTORE_VERSIONE = "2"
+
+
+# ── Ammortamento ──────────────────────────────────────────────────────────────
+def rata_francese(importo, tasso_ann, n_mesi) -> np.ndarray:
+    """Rata mensile costante (capitale + interessi). `tasso_ann` come frazione."""
+    importo = np.asarray(importo, dtype=float)
+    r = np.asarray(tasso_ann, dtype=float) / 12
+    n = np.asarray(n_mesi, dtype=float)
+    ok = (r > 0) & (n > 0)
+    r_ok = np.where(ok, r, 1.0)
+    n_ok = np.where(ok, n, 1.0)
+    return np.where(ok, importo * r_ok / (1 - (1 + r_ok) ** (-n_ok)), 0.0)
+
+
+def piano_ammortamento(importo, tasso_ann, n_mesi, mesi: int):
+    """
+    Debito residuo e interessi cumulati mese per mese, per ogni scenario.
+    Ritorna due matrici (scenari × mesi+1); la colonna 0 è l'erogazione.
+    Oltre la durata dello scenario il debito resta a zero.
+    """
+    P = np.atleast_1d(np.asarray(importo, dtype=float))[:, None]
+    r = np.atleast_1d(np.asarray(tasso_ann, dtype=float))[:, None] / 12
+    n = np.floor(np.atleast_1d(np.asarray(n_mesi, dtype=float)))[:, None]
+    R = rata_francese(P, r * 12, n)
+    k = np.arange(mesi + 1, dtype=float)[None, :]
+
+    ok = (r > 0) & (n > 0)
+    r_ok = np.where(ok, r, 1.0)
+    f = (1 + r_ok) ** k
+    debito = np.where(ok, P * f - R * (f - 1) / r_ok, P)
+    debito = np.where(ok & (k >= n), 0.0, np.maximum(debito, 0.0))
+    interessi = R * np.minimum(k, n) - (P - debito)
+    return debito, interessi
+
+
+def curva_rata_tasso(importo, n_mesi, tassi) -> np.ndarray:
+    """Rata in funzione del tasso: matrice (scenari × tassi)."""
+    P = np.atleast_1d(np.asarray(importo, dtype=float))[:, None]
+    n = np.atleast_1d(np.asarray(n_mesi, dtype=float))[:, None]
+    return rata_francese(P, np.asarray(tassi, dtype=float)[None, :], n)
+
+
+# ── Riduzione a risoluzione pixel ─────────────────────────────────────────────
+def riduci_a_pixel(x: np.ndarray, Y: np.ndarray, larghezza: int):
+    """
+    Riduzione M4 (primo, minimo, massimo, ultimo per colonna di pixel).
+    Con più di 4 punti per pixel il tracciato disegnato è identico a quello
+    completo; altrimenti i dati tornano invariati.
+    """
+    Y = np.atleast_2d(Y)
+    n = Y.shape[1]
+    if larghezza <= 0 or n <= 4 * larghezza:
+        return x, Y
+    inizi = np.unique(np.linspace(0, n, larghezza + 1).astype(int)[:-1])
+    fini = np.append(inizi[1:], n) - 1
+    medi = (inizi + fini) // 2
+    xr = np.stack([x[inizi], x[medi], x[medi], x[fini]], axis=1).ravel()
+    Yr = np.stack([
+        Y[:, inizi],
+        np.minimum.reduceat(Y, inizi, axis=1),
+        np.maximum.reduceat(Y, inizi, axis=1),
+        Y[:, fini],
+    ], axis=2).reshape(Y.shape[0], -1)
+    return xr, Yr
+
+
+# ── Costi d'acquisto ──────────────────────────────────────────────────────────
+def costo_agenzia(prezzo, valore, iva_pct, su_prezzo):
+    """
+    Provvigione agenzia: (totale_lordo, imponibile, iva_importo).
+    Con `su_prezzo` il valore è una % del prezzo più IVA, altrimenti un
+    importo in € già lordo.
+    """
+    prezzo = np.asarray(prezzo, dtype=float)
+    valore = np.asarray(valore, dtype=float)
+    iva_pct = np.asarray(iva_pct, dtype=float)
+    imponibile = np.where(su_prezzo, prezzo * valore / 100, valore)
+    iva_imp = np.where(su_prezzo, imponibile * iva_pct / 100, 0.0)
+    return imponibile + iva_imp, imponibile, iva_imp
+
+
+# ── Riferimento scalare ───────────────────────────────────────────────────────
+def _pol_breakdown(imp: float, mode: str, n_mesi: float):
+    """Restituisce (mensile, annuale, tot_durata, unica)."""
+    if mode == "In rata":
+        return imp, 0.0, imp * n_mesi, 0.0
+    elif mode == "Annuale":
+        return imp / 12, imp, imp / 12 * n_mesi, 0.0
+    else:  # Unica soluzione
+        return 0.0, 0.0, imp, imp
+
+
+def calcola_taeg(
+    importo: float,
+    upfront_costs: float,
+    rata_base: float,
+    n: int,
+    pol_si_imp: float,
+    pol_si_mode: str,
+) -> float | None:
+    """
+    TAEG (EU Mortgage Credit Directive).
+    Risolve: (importo - upfront_costs) = Σ CF_k / (1+r)^k  per r mensile.
+    Ritorna il tasso annuale effettivo globale in percentuale, o None se non calcolabile.
+    Inclusi nei CF: rata_base + pol. scoppio/incendio (obbligatoria).
+    Upfront: istruttoria + perizia + imp. sostitutiva + pol. unica scoppio/incendio.
+    """
+    net = importo - upfront_costs
+    if net <= 0 or n <= 0 or rata_base <= 0:
+        return None
+
+    cfs = []
+    for k in range(1, int(n) + 1):
+        cf = rata_base
+        if pol_si_mode == "In rata":
+            cf += pol_si_imp
+        elif pol_si_mode == "Annuale" and k % 12 == 0:
+            cf += pol_si_imp
+        cfs.append(cf)
+
+    def npv(mr: float) -> float:
+        return sum(c / (1 + mr) ** k for k, c in enumerate(cfs, 1)) - net
+
+    try:
+        lo, hi = 1e-9, 0.5
+        if npv(lo) * npv(hi) > 0:
+            return None
+        for _ in range(120):
+            mid = (lo + hi) / 2
+            if npv(mid) > 0:
+                lo = mid
+            else:
+                hi = mid
+        return ((1 + (lo + hi) / 2) ** 12 - 1) * 100
+    except Exception:
+        return None
+
+
+def calcola_scenario(p: dict, prezzo: float, notaio: float, agenzia: float,
+                     imposta: float, agenzia_extra: dict | None = None,
+                     under36: bool = False, data=None) -> dict:
+    """
+    Calcolo di un singolo scenario (parametri come da MutuoWidget.parametri).
+    È l'implementazione di riferimento: calcola_righe deve dare gli stessi numeri.
+    `under36` e `data` (del rogito) scelgono l'aliquota dell'imposta sostitutiva.
+    """
+    raw     = p["importo"]
+    importo = prezzo * raw / 100 if p["mutuo_mode"] == "% Prezzo" else raw
+    pct     = raw if p["mutuo_mode"] == "% Prezzo" else (
+        raw / prezzo * 100 if prezzo else 0
+    )
+    tasso_ann  = p["tasso"] / 100
+    durata_ann = p["durata"]
+
+    r = tasso_ann / 12
+    n = durata_ann * 12
+    rata_base = importo * r / (1 - (1 + r) ** (-n)) if r > 0 and n > 0 else 0.0
+
+    pol_si_imp  = p["pol_si"]
+    pol_v_imp   = p["pol_v"]
+    pol_si_mode = p["pol_si_mode"]
+    pol_v_mode  = p["pol_v_mode"]
+
+    pol_si_mens, _, pol_si_tot, pol_si_unica = _pol_breakdown(pol_si_imp, pol_si_mode, n)
+    pol_v_mens,  _, pol_v_tot,  pol_v_unica  = _pol_breakdown(pol_v_imp,  pol_v_mode,  n)
+
+    # Spese bancarie
+    istruttoria = p["istruttoria"]
+    perizia     = p["perizia"]
+    imp_sost_mode = p["imp_sost_mode"]
+    if imp_sost_mode in ("Prima casa", "Seconda casa"):
+        imp_sost = importo * float(aliquota_sostitutiva(imp_sost_mode, under36, data))
+    else:
+        imp_sost = p["imp_sost"]
+
+    rata           = rata_base + pol_si_mens + pol_v_mens
+    tot_restituito = rata_base * n
+    tot_interessi  = tot_restituito - importo
+    acconto        = prezzo - importo
+    tot_costi_iniz = (acconto + notaio + agenzia + imposta
+                      + pol_si_unica + pol_v_unica
+                      + istruttoria + perizia + imp_sost)
+    costo_totale   = (tot_restituito + tot_interessi
+                      + pol_si_tot + pol_v_tot
+                      + notaio + agenzia + imposta
+                      + istruttoria + perizia + imp_sost)
+
+    # TAEG — costi upfront inclusi: istruttoria, perizia, imp.sost., pol.unica scoppio
+    taeg = calcola_taeg(
+        importo,
+        upfront_costs=istruttoria + perizia + imp_sost + pol_si_unica,
+        rata_base=rata_base,
+        n=int(n),
+        pol_si_imp=pol_si_imp,
+        pol_si_mode=pol_si_mode,
+    )
+
+    return {
+        "label":          p["label"],
+        "prezzo":         prezzo,
+        "importo":        importo,
+        "pct_mutuo":      pct,
+        "tasso_ann":      tasso_ann * 100,
+        "durata_ann":     durata_ann,
+        "rata_base":      rata_base,
+        "rata":           rata,
+        "tot_restituito": tot_restituito,
+        "tot_interessi":  tot_interessi,
+        "acconto":        acconto,
+        "notaio":         notaio,
+        "agenzia":        agenzia,
+        "agenzia_tot":    agenzia,
+        **(agenzia_extra or {}),
+        "imposta":        imposta,
+        "pol_si_imp":     pol_si_imp,  "pol_si_mode":  pol_si_mode,
+        "pol_si_mens":    pol_si_mens, "pol_si_tot":   pol_si_tot,
+        "pol_si_unica":   pol_si_unica,
+        "pol_v_imp":      pol_v_imp,   "pol_v_mode":   pol_v_mode,
+        "pol_v_mens":     pol_v_mens,  "pol_v_tot":    pol_v_tot,
+        "pol_v_unica":    pol_v_unica,
+        "istruttoria":    istruttoria,
+        "perizia":        perizia,
+        "imp_sost":       imp_sost,
+        "imp_sost_mode":  imp_sost_mode,
+        "taeg":           taeg,
+        "tot_costi_iniz": tot_costi_iniz,
+        "costo_totale":   costo_totale,
+    }
+
+
+# ── Calcolo vettoriale ────────────────────────────────────────────────────────
+def _pol_breakdown_v(imp: np.ndarray, mode: np.ndarray, n_mesi: np.ndarray):
+    """Come _pol_breakdown, su array: (mensile, tot_durata, unica)."""
+    in_rata = mode == "In rata"
+    annuale = mode == "Annuale"
+    unica = ~(in_rata | annuale)
+    mensile = np.where(in_rata, imp, np.where(annuale, imp / 12, 0.0))
+    tot = np.where(unica, imp, mensile * n_mesi)
+    return mensile, tot, np.where(unica, imp, 0.0)
+
+
+def calcola_taeg_v(importo, upfront_costs, rata_base, n, pol_si_imp,
+                   pol_si_mode) -> np.ndarray:
+    """
+    TAEG vettoriale: stessa bisezione di calcola_taeg (120 passi su
+    [1e-9, 0.5]), con il valore attuale dei flussi in forma chiusa.
+    NaN dove calcola_taeg ritornerebbe None.
+    """
+    importo = np.asarray(importo, dtype=float)
+    net = importo - np.asarray(upfront_costs, dtype=float)
+    rata_base = np.broadcast_to(np.asarray(rata_base, dtype=float), net.shape)
+    n = np.broadcast_to(np.asarray(n, dtype=float), net.shape)
+    pol = np.broadcast_to(np.asarray(pol_si_imp, dtype=float), net.shape)
+    mode = np.broadcast_to(np.asarray(pol_si_mode), net.shape)
+
+    # Flusso mensile costante + eventuale premio ogni 12 mesi
+    cf_mese = rata_base + np.where(mode == "In rata", pol, 0.0)
+    cf_anno = np.where(mode == "Annuale", pol, 0.0)
+    anni = np.floor(n / 12)
+
+    def npv(mr):
+        lv = np.log1p(mr)
+        ann_mese = -np.expm1(-n * lv) / mr
+        ann_anno = np.exp(-12 * lv) * -np.expm1(-12 * anni * lv) / -np.expm1(-12 * lv)
+        return cf_mese * ann_mese + cf_anno * ann_anno - net
+
+    valido = (net > 0) & (n > 0) & (rata_base > 0)
+    lo = np.full(net.shape, 1e-9)
+    hi = np.full(net.shape, 0.5)
+    with np.errstate(all="ignore"):
+        valido &= ~(npv(lo) * npv(hi) > 0)
+        for _ in range(120):
+            mid = (lo + hi) / 2
+            pos = npv(mid) > 0
+            lo = np.where(pos, mid, lo)
+            hi = np.where(pos, hi, mid)
+        taeg = ((1 + (lo + hi) / 2) ** 12 - 1) * 100
+    return np.where(valido & np.isfinite(taeg), taeg, np.nan)
+
+
+# Colonne immobile facoltative di calcola_righe (data None = oggi)
+DEFAULT_IMMOBILE = {"venditore": "Privato", "under36": False, "data": None}
+
+# Campi risultato che ripetono una colonna d'ingresso (risultato -> ingresso)
+COLONNE_ECO = {
+    "immobile":      "immobile",
+    "label":         "label",
+    "agenzia_mode":  "agenzia_mode",
+    "imp_tipo":      "imposta_tipo",
+    "imp_venditore": "venditore",
+    "imp_under36":   "under36",
+    "pol_si_mode":   "pol_si_mode",
+    "pol_v_mode":    "pol_v_mode",
+    "imp_sost_mode": "imp_sost_mode",
+}
+
+CAMPI_RISULTATO = (
+    "immobile", "label", "prezzo", "importo", "pct_mutuo", "tasso_ann",
+    "durata_ann", "rata_base", "rata", "tot_restituito", "tot_interessi",
+    "acconto", "notaio", "agenzia", "agenzia_tot", "agenzia_impon",
+    "agenzia_iva", "agenzia_pct", "agenzia_iva_pct", "agenzia_mode",
+    "imp_tipo", "imp_venditore", "imp_under36", "imp_pct", "imp_registro",
+    "imp_ipotecaria", "imp_catastale", "imp_iva_pct", "imp_iva",
+    "imp_credito_iva", "imposta",
+    "pol_si_imp", "pol_si_mode", "pol_si_mens", "pol_si_tot", "pol_si_unica",
+    "pol_v_imp", "pol_v_mode", "pol_v_mens", "pol_v_tot", "pol_v_unica",
+    "istruttoria", "perizia", "imp_sost", "imp_sost_mode", "taeg",
+    "tot_costi_iniz", "costo_totale",
+)
+CAMPI_NUMERICI = tuple(k for k in CAMPI_RISULTATO if k not in COLONNE_ECO)
+
+
+def prodotto_incrociato(immobili: list[dict], scenari: list[dict]) -> dict:
+    """
+    Colonne per tutte le coppie immobile × scenario, immobile per immobile
+    (la riga i*M + j è l'immobile i con lo scenario j).
+    """
+    n, m = len(immobili), len(scenari)
+    colonne = {k: np.repeat(np.array([d[k] for d in immobili]), m)
+               for k in immobili[0]}
+    colonne.update({k: np.tile(np.array([d[k] for d in scenari]), n)
+                    for k in scenari[0]})
+    return colonne
+
+
+def calcola_righe(c: dict, cache=None, taeg: bool = True) -> RisultatiScenari:
+    """
+    Come _calcola_righe; con una CacheRisultati le righe già calcolate in
+    passato vengono lette da disco e solo le nuove passano dal motore.
+    Con taeg=False salta la ricerca del TAEG, la parte costosa, e lascia la
+    colonna a NaN: utile per una prima selezione (la cache non è usata).
+    """
+    if not taeg:
+        return _calcola_righe(c, taeg=False)
+    if cache is None:
+        return _calcola_righe(c)
+    return cache.calcola(c, _calcola_righe)
+
+
+def _calcola_righe(c: dict, taeg: bool = True) -> RisultatiScenari:
+    """
+    Calcolo vettoriale di N righe in un'unica passata. Ogni colonna di `c`
+    ha un valore per riga: i campi immobile (immobile, prezzo, notaio,
+    val_catastale, imposta_tipo, agenzia_mode, agenzia, agenzia_iva e,
+    facoltativi, venditore, under36, data) e i parametri scenario di
+    MutuoWidget.parametri. Ritorna le stesse chiavi di calcola_scenario in
+    un RisultatiScenari (taeg = NaN se non calcolabile).
+    """
+    def f(k):
+        return np.asarray(c[k], dtype=float)
+
+    prezzo = f("prezzo")
+    notaio = f("notaio")
+
+    # Agenzia e imposte, per immobile
+    agenzia_su_prezzo = np.asarray(c["agenzia_mode"]) == "% Prezzo"
+    agenzia, agenzia_impon, agenzia_iva = costo_agenzia(
+        prezzo, f("agenzia"), f("agenzia_iva"), agenzia_su_prezzo)
+    venditore = np.asarray(c.get("venditore", DEFAULT_IMMOBILE["venditore"]))
+    under36 = np.asarray(c.get("under36", DEFAULT_IMMOBILE["under36"]), dtype=bool)
+    data = c.get("data", DEFAULT_IMMOBILE["data"])
+    imp = imposte_acquisto(prezzo, f("val_catastale"), venditore,
+                           np.asarray(c["imposta_tipo"]), under36, data)
+    imposta = imp["totale"]
+
+    # Mutuo
+    raw = f("importo")
+    su_prezzo = np.asarray(c["mutuo_mode"]) == "% Prezzo"
+    prezzo_div = np.where(prezzo != 0, prezzo, 1.0)
+    importo = np.where(su_prezzo, prezzo * raw / 100, raw)
+    pct = np.where(su_prezzo, raw, np.where(prezzo != 0, raw / prezzo_div * 100, 0.0))
+    tasso_ann = f("tasso") / 100
+    durata_ann = f("durata")
+    n = durata_ann * 12
+    rata_base = rata_francese(importo, tasso_ann, n)
+
+    pol_si_imp, pol_si_mode = f("pol_si"), np.asarray(c["pol_si_mode"])
+    pol_v_imp,  pol_v_mode  = f("pol_v"),  np.asarray(c["pol_v_mode"])
+    pol_si_mens, pol_si_tot, pol_si_unica = _pol_breakdown_v(pol_si_imp, pol_si_mode, n)
+    pol_v_mens,  pol_v_tot,  pol_v_unica  = _pol_breakdown_v(pol_v_imp,  pol_v_mode,  n)
+
+    # Spese bancarie
+    istruttoria = f("istruttoria")
+    perizia     = f("perizia")
+    imp_sost_mode = np.asarray(c["imp_sost_mode"])
+    auto = np.isin(imp_sost_mode, ("Prima casa", "Seconda casa"))
+    aliquota = aliquota_sostitutiva(
+        np.where(auto, imp_sost_mode, "Prima casa"), under36, data)
+    imp_sost = np.where(auto, importo * aliquota, f("imp_sost"))
+
+    rata           = rata_base + pol_si_mens + pol_v_mens
+    tot_restituito = rata_base * n
+    tot_interessi  = tot_restituito - importo
+    acconto        = prezzo - importo
+    tot_costi_iniz = (acconto + notaio + agenzia + imposta
+                      + pol_si_unica + pol_v_unica
+                      + istruttoria + perizia + imp_sost)
+    costo_totale   = (tot_restituito + tot_interessi
+                      + pol_si_tot + pol_v_tot
+                      + notaio + agenzia + imposta
+                      + istruttoria + perizia + imp_sost)
+
+    taeg = calcola_taeg_v(
+        importo,
+        upfront_costs=istruttoria + perizia + imp_sost + pol_si_unica,
+        rata_base=rata_base,
+        n=np.trunc(n),
+        pol_si_imp=pol_si_imp,
+        pol_si_mode=pol_si_mode,
+    ) if taeg else np.full(importo.shape, np.nan)
+
+    return RisultatiScenari({
+        "immobile":        np.asarray(c["immobile"]),
+        "label":           np.asarray(c["label"]),
+        "prezzo":          prezzo,
+        "importo":         importo,
+        "pct_mutuo":       pct,
+        "tasso_ann":       tasso_ann * 100,
+        "durata_ann":      durata_ann,
+        "rata_base":       rata_base,
+        "rata":            rata,
+        "tot_restituito":  tot_restituito,
+        "tot_interessi":   tot_interessi,
+        "acconto":         acconto,
+        "notaio":          notaio,
+        "agenzia":         agenzia,
+        "agenzia_tot":     agenzia,
+        "agenzia_impon":   agenzia_impon,
+        "agenzia_iva":     agenzia_iva,
+        "agenzia_pct":     np.where(agenzia_su_prezzo, f("agenzia"), 0.0),
+        "agenzia_iva_pct": f("agenzia_iva"),
+        "agenzia_mode":    np.asarray(c["agenzia_mode"]),
+        "imp_tipo":        np.asarray(c["imposta_tipo"]),
+        "imp_venditore":   np.broadcast_to(venditore, prezzo.shape),
+        "imp_under36":     np.broadcast_to(under36, prezzo.shape),
+        "imp_pct":         imp["pct"],
+        "imp_registro":    imp["registro"],
+        "imp_ipotecaria":  imp["ipotecaria"],
+        "imp_catastale":   imp["catastale"],
+        "imp_iva_pct":     imp["iva_pct"],
+        "imp_iva":         imp["iva"],
+        "imp_credito_iva": imp["credito"],
+        "imposta":         imposta,
+        "pol_si_imp":      pol_si_imp,  "pol_si_mode":  pol_si_mode,
+        "pol_si_mens":     pol_si_mens, "pol_si_tot":   pol_si_tot,
+        "pol_si_unica":    pol_si_unica,
+        "pol_v_imp":       pol_v_imp,   "pol_v_mode":   pol_v_mode,
+        "pol_v_mens":      pol_v_mens,  "pol_v_tot":    pol_v_tot,
+        "pol_v_unica":     pol_v_unica,
+        "istruttoria":     istruttoria,
+        "perizia":         perizia,
+        "imp_sost":        imp_sost,
+        "imp_sost_mode":   imp_sost_mode,
+        "taeg":            taeg,
+        "tot_costi_iniz":  tot_costi_iniz,
+        "costo_totale":    costo_totale,
+    }, np.size(importo))
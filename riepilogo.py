@@ -0,0 +1,255 @@
+"""
+Schema del riepilogo scenario, condiviso da riepilogo testuale, PDF e CSV.
+
+Le voci sono dichiarate una volta sola in SEZIONI; ModelloRiepilogo le
+compila in renderer per il testo a larghezza fissa, per i dati delle tabelle
+ReportLab e per il CSV. Per aggiungere un campo al riepilogo basta una Voce.
+"""
+import csv
+from typing import Callable, NamedTuple
+
+import numpy as np
+
+from risultati import RisultatiScenari
+
+# ── Formattazione ─────────────────────────────────────────────────────────────
+def fmt_eur(value: float) -> str:
+    """Importo in formato italiano: € 1.234,56."""
+    # "_" come separatore migliaia: due replace, più veloci di str.translate
+    return f"€ {value:_.2f}".replace(".", ",").replace("_", ".")
+
+
+def fmt_eur_colonna(valori) -> list[str]:
+    """fmt_eur su tutta una colonna: una sola format e due replace sul blocco."""
+    valori = list(valori)
+    testo = ("€ {:_.2f}\n" * len(valori)).format(*valori)
+    return testo.replace(".", ",").replace("_", ".").split("\n")[:-1]
+
+
+def _formatta_colonna(formato: str, valori) -> list[str]:
+    valori = list(valori)
+    return ((formato + "\n") * len(valori)).format(*valori).split("\n")[:-1]
+
+
+def _manca(x) -> bool:
+    return x is None or x != x  # None da calcola_scenario, NaN dal motore
+
+
+def _pol_line(imp: float, mode: str, mensile: float) -> str:
+    if imp == 0:
+        return "non inserita"
+    if mode == "In rata":
+        return f"{fmt_eur(imp)}/mese (in rata)"
+    elif mode == "Annuale":
+        return f"{fmt_eur(imp)}/anno  (≈ {fmt_eur(mensile)}/mese)"
+    else:
+        return f"{fmt_eur(imp)} unica soluzione"
+
+
+def _nota_registro(d: dict) -> str:
+    if d.get("imp_under36") and d.get("imp_registro", 0) == 0:
+        return "esente under 36"
+    if d.get("imp_venditore") == "Costruttore":
+        return "fissa, acquisto con IVA"
+    return f"{d.get('imp_tipo', '')}, {d.get('imp_pct', 0) * 100:.1f}% v.c."
+
+
+def _nota_fissa(valore: float) -> str:
+    return "fissa" if valore else "esente"
+
+
+def _nota_agenzia(d: dict) -> str | None:
+    if d.get("agenzia_mode") != "% Prezzo":
+        return None
+    return f"{d['agenzia_pct']:.2f}% + IVA {d['agenzia_iva_pct']:.0f}%"
+
+
+def titolo(d: dict) -> str:
+    return (f"{d['label']} — {fmt_eur(d['importo'])}"
+            f" ({d['pct_mutuo']:.1f}% del prezzo · {int(d['durata_ann'])} anni)")
+
+
+# ── Schema ────────────────────────────────────────────────────────────────────
+class Voce(NamedTuple):
+    """
+    Una riga del riepilogo. `campo` è il valore numerico esportato nel CSV
+    (None: voce solo descrittiva). Il testo è fmt_eur del campo, oppure
+    `formato` (str.format) applicato al campo, oppure `valore(d)` sulla riga.
+    `nota(d)` va tra parentesi; `se(c)` riceve le colonne e ritorna la
+    maschera delle righe in cui la voce compare.
+    """
+    etichetta: str
+    campo: str | None
+    formato: str | None = None
+    valore: Callable[[dict], str] | None = None
+    nota: Callable[[dict], str | None] | None = None
+    se: Callable[[dict], np.ndarray] | None = None
+
+
+SEZIONI = {
+    "Mutuo": (
+        Voce("Importo mutuo", "importo",
+             nota=lambda d: f"{d['pct_mutuo']:.1f}% del prezzo"),
+        Voce("Tasso annuo (TAN)", "tasso_ann", "{:.2f} %"),
+        Voce("TAEG", "taeg",
+             valore=lambda d: "n.d." if _manca(d["taeg"]) else f"{d['taeg']:.2f} %"),
+        Voce("Durata", "durata_ann",
+             valore=lambda d: f"{int(d['durata_ann'])} anni"),
+        Voce("Rata mutuo", "rata_base"),
+        Voce("+ Pol. scoppio/inc.", "pol_si_imp",
+             valore=lambda d: _pol_line(d["pol_si_imp"], d["pol_si_mode"],
+                                        d["pol_si_mens"])),
+        Voce("+ Pol. vita", "pol_v_imp",
+             valore=lambda d: _pol_line(d["pol_v_imp"], d["pol_v_mode"],
+                                        d["pol_v_mens"])),
+        Voce("Rata totale", "rata"),
+        Voce("Interessi totali", "tot_interessi"),
+        Voce("Totale restituito", "tot_restituito"),
+        Voce("Polizze (intera durata)", None,
+             valore=lambda d: fmt_eur(d["pol_si_tot"] + d["pol_v_tot"])),
+    ),
+    "Costi iniziali": (
+        Voce("Acconto", "acconto"),
+        Voce("Notaio", "notaio"),
+        Voce("Agenzia", "agenzia_tot", nota=_nota_agenzia),
+        Voce("Imp. di registro", "imp_registro", nota=_nota_registro),
+        Voce("Imp. ipotecaria", "imp_ipotecaria",
+             nota=lambda d: _nota_fissa(d["imp_ipotecaria"])),
+        Voce("Imp. catastale", "imp_catastale",
+             nota=lambda d: _nota_fissa(d["imp_catastale"])),
+        Voce("IVA acquisto", "imp_iva",
+             nota=lambda d: f"{d['imp_iva_pct'] * 100:.0f}%",
+             se=lambda c: c["imp_iva"] > 0),
+        Voce("Credito d'imposta", "imp_credito_iva",
+             valore=lambda d: f"− {fmt_eur(d['imp_credito_iva'])}",
+             nota=lambda d: "IVA under 36",
+             se=lambda c: c["imp_credito_iva"] > 0),
+        Voce("Spese istruttoria", "istruttoria"),
+        Voce("Spese perizia", "perizia"),
+        Voce("Imposta sostitutiva", "imp_sost", nota=lambda d: d["imp_sost_mode"]),
+        Voce("Pol. scoppio/inc. (unica)", "pol_si_unica",
+             se=lambda c: c["pol_si_unica"] > 0),
+        Voce("Pol. vita (unica)", "pol_v_unica",
+             se=lambda c: c["pol_v_unica"] > 0),
+        Voce("Tot. costi iniziali", "tot_costi_iniz"),
+    ),
+}
+TOTALE = Voce("COSTO TOTALE", "costo_totale")
+
+
+# ── Compilazione ──────────────────────────────────────────────────────────────
+class ModelloRiepilogo:
+    """
+    Schema compilato una volta. I render lavorano per colonne: ogni voce è
+    formattata su tutte le righe insieme, poi le righe vengono assemblate.
+    Accettano un RisultatiScenari o una lista di dict (calcola_scenario).
+    """
+
+    def __init__(self, sezioni: dict = SEZIONI, totale: Voce = TOTALE):
+        voci = [(s, v) for s, vv in sezioni.items() for v in vv] + [(None, totale)]
+        larghezza = max(len(v.etichetta) for _, v in voci) + 3  # ":" e 2 spazi
+        # (sezione, voce, prefisso nel riepilogo testuale) in ordine
+        self._voci = [
+            (s, v, f"  {v.etichetta + ':':<{larghezza}}" if s is not None
+             else f"  ► {v.etichetta + ':':<{larghezza - 2}}")
+            for s, v in voci
+        ]
+        self.sezioni = tuple(sezioni)
+        self.totale = totale
+        self.campi_csv = [(v.etichetta, v.campo) for _, v in voci if v.campo]
+
+    @staticmethod
+    def righe(ris) -> list[dict]:
+        """Righe come dict semplici: da RisultatiScenari per colonne, in blocco."""
+        if not isinstance(ris, RisultatiScenari):
+            return list(ris)
+        colonne = [ris[k].tolist() for k in ris.campi]
+        return [dict(zip(ris.campi, valori)) for valori in zip(*colonne)]
+
+    @staticmethod
+    def _colonne(ris, righe: list[dict]) -> dict:
+        if isinstance(ris, RisultatiScenari):
+            return ris
+        return {k: np.array([np.nan if _manca(d[k]) else d[k] for d in righe])
+                for k in (righe[0] if righe else ())}
+
+    def _celle(self, ris):
+        """Righe dict e, per voce: (sezione, voce, prefisso, testi, note, maschera)."""
+        righe = self.righe(ris)
+        c = self._colonne(ris, righe)
+        celle = []
+        for s, v, prefisso in self._voci:
+            if v.valore is not None:
+                testi = [v.valore(d) for d in righe]
+            else:
+                # Ogni valore distinto è formattato una volta sola: agenzia,
+                # imposte, notaio... sono uguali per tutti gli scenari
+                distinti, codici = np.unique(c[v.campo], return_inverse=True)
+                testi = (fmt_eur_colonna(distinti.tolist()) if v.formato is None
+                         else _formatta_colonna(v.formato, distinti.tolist()))
+                testi = np.array(testi, dtype=object)[codici].tolist()
+            note = [v.nota(d) for d in righe] if v.nota else None
+            maschera = np.asarray(v.se(c)).tolist() if v.se else None
+            celle.append((s, v, prefisso, testi, note, maschera))
+        return righe, celle
+
+    # ── Render ────────────────────────────────────────────────────────────
+    def testo(self, ris) -> list[str]:
+        """Blocco di righe a larghezza fissa per ogni scenario."""
+        righe, celle = self._celle(ris)
+        n = len(righe)
+        # Righe di testo complete per voce, poi raccolte scenario per scenario
+        colonne = []
+        sezione = self.sezioni[0]
+        for s, _, prefisso, testi, note, maschera in celle:
+            if s is not None and s != sezione:
+                colonne.append(
+                    (["  ───────────────────────────────────────────────"] * n, None))
+                sezione = s
+            if note:
+                linee = [f"{prefisso}{t}  ({x})" if x else prefisso + t
+                         for t, x in zip(testi, note)]
+            else:
+                linee = [prefisso + t for t in testi]
+            colonne.append((linee, maschera))
+
+        lines = []
+        for i, d in enumerate(righe):
+            lines += ["", f"── {titolo(d)} ──"]
+            lines += [linee[i] for linee, maschera in colonne
+                      if maschera is None or maschera[i]]
+        return lines
+
+    def tabelle(self, ris) -> list[dict]:
+        """
+        Dati delle tabelle PDF, uno per scenario:
+        {sezione: [["Voce", "Importo"], [voce, importo], ...]}.
+        """
+        righe, celle = self._celle(ris)
+        tabelle = []
+        for i in range(len(righe)):
+            t = {s: [["Voce", "Importo"]] for s in self.sezioni}
+            for s, v, _, testi, note, maschera in celle:
+                if s is None or (maschera is not None and not maschera[i]):
+                    continue
+                nota = note[i] if note else None
+                t[s].append([v.etichetta + (f" ({nota})" if nota else ""), testi[i]])
+            tabelle.append(t)
+        return tabelle
+
+    def a_csv(self, f, ris, intestazione: bool = True):
+        """Valori numerici delle voci, una riga per scenario; NaN come cella vuota."""
+        w = csv.writer(f)
+        if intestazione:
+            w.writerow(["Immobile", "Scenario", *(e for e, _ in self.campi_csv)])
+        if isinstance(ris, RisultatiScenari):
+            colonne = [ris[k].tolist() for k in ("immobile", "label")]
+            colonne += [ris[k].tolist() for _, k in self.campi_csv]
+            w.writerows(["" if x != x else x for x in r] for r in zip(*colonne))
+            return
+        for d in ris:
+            w.writerow([d.get("immobile", ""), d["label"],
+                        *("" if _manca(d[k]) else d[k] for _, k in self.campi_csv)])
+
+
+MODELLO = ModelloRiepilogo()
@@ -0,0 +1,203 @@
+"""
+Risultati degli scenari in forma colonnare (struct of arrays).
+
+Al posto di un dict per scenario c'è un array NumPy per campo. I campi con
+lo stesso valore su tutte le righe (per esempio agenzia e imposte quando si
+confrontano solo scenari mutuo) sono salvati una volta sola, i campi testo
+come codici su un elenco di valori distinti. Le righe restano leggibili come
+dict in sola lettura e le fette non copiano i dati.
+"""
+import csv
+from collections.abc import Mapping
+from itertools import repeat
+
+import numpy as np
+
+_BLOCCO_CSV = 65_536  # righe convertite in liste Python per volta
+
+
+class _Categorie:
+    """Colonna testo: valori distinti più un codice intero per riga."""
+    __slots__ = ("valori", "codici")
+
+    def __init__(self, valori: np.ndarray, codici: np.ndarray):
+        self.valori = valori
+        self.codici = codici
+
+    @property
+    def nbytes(self) -> int:
+        return self.valori.nbytes + self.codici.nbytes
+
+
+def _compatta(v, n: int):
+    """Forma interna di una colonna: array 0-d se costante, _Categorie se testo."""
+    v = np.asarray(v)
+    if v.ndim == 0:
+        return v
+    if v.shape != (n,):
+        raise ValueError(f"Colonna di {v.shape} valori, attese {n} righe")
+    if n == 0:
+        return v
+    if v.strides == (0,):  # np.broadcast_to di un valore unico
+        return np.asarray(v[0])
+    if v.dtype.kind in "USO":
+        valori, codici = np.unique(v.astype(str), return_inverse=True)
+        if len(valori) == 1:
+            return np.asarray(valori[0])
+        return _Categorie(valori, codici.astype(np.min_scalar_type(len(valori) - 1)))
+    if (v == v[0]).all():
+        return np.asarray(v[0])
+    return v
+
+
+class RigaScenario(Mapping):
+    """Una riga dei risultati vista come dict (taeg NaN -> None)."""
+    __slots__ = ("_ris", "_i")
+
+    def __init__(self, ris: "RisultatiScenari", i: int):
+        self._ris = ris
+        self._i = i
+
+    def __getitem__(self, k):
+        return self._ris._valore(k, self._i)
+
+    def __iter__(self):
+        return iter(self._ris.campi)
+
+    def __len__(self):
+        return len(self._ris.campi)
+
+    def __repr__(self):
+        return f"RigaScenario({dict(self)!r})"
+
+
+class RisultatiScenari:
+    """
+    Risultati di N righe. `ris["rata"]` è la colonna (N,), `ris[i]` la riga i
+    come RigaScenario, `ris[a:b]` un sottoinsieme che condivide i dati.
+    Iterare restituisce le righe, come una lista di dict.
+    """
+
+    def __init__(self, colonne: dict, n: int | None = None):
+        if n is None:
+            n = max((len(v) for v in colonne.values() if np.ndim(v)), default=1)
+        self._n = n
+        self._colonne = {k: (v if isinstance(v, _Categorie) else _compatta(v, n))
+                         for k, v in colonne.items()}
+
+    # ── Accesso ───────────────────────────────────────────────────────────
+    @property
+    def campi(self) -> tuple:
+        return tuple(self._colonne)
+
+    @property
+    def condivisi(self) -> tuple:
+        """Campi salvati una volta sola perché uguali su tutte le righe."""
+        return tuple(k for k, c in self._colonne.items()
+                     if not isinstance(c, _Categorie) and c.ndim == 0)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(c.nbytes for c in self._colonne.values())
+
+    def __len__(self):
+        return self._n
+
+    def __contains__(self, k):
+        return k in self._colonne
+
+    def __iter__(self):
+        return (RigaScenario(self, i) for i in range(self._n))
+
+    def __getitem__(self, chiave):
+        if isinstance(chiave, str):
+            return self.colonna(chiave)
+        if isinstance(chiave, (int, np.integer)):
+            i = int(chiave) + (self._n if chiave < 0 else 0)
+            if not 0 <= i < self._n:
+                raise IndexError(f"Riga {chiave} fuori intervallo ({self._n} righe)")
+            return RigaScenario(self, i)
+        return self._seleziona(chiave)
+
+    def colonna(self, k: str) -> np.ndarray:
+        """Valori del campo per tutte le righe (vista se possibile)."""
+        c = self._colonne[k]
+        if isinstance(c, _Categorie):
+            return c.valori[c.codici]
+        if c.ndim == 0:
+            return np.broadcast_to(c, (self._n,))
+        return c
+
+    def colonne(self) -> dict:
+        return {k: self.colonna(k) for k in self._colonne}
+
+    def _valore(self, k: str, i: int):
+        c = self._colonne[k]
+        if isinstance(c, _Categorie):
+            v = c.valori[c.codici[i]]
+        else:
+            v = c[()] if c.ndim == 0 else c[i]
+        v = v.item()
+        return None if v != v else v  # NaN (non calcolabile) come in calcola_scenario
+
+    def _seleziona(self, idx) -> "RisultatiScenari":
+        if isinstance(idx, slice):
+            n = len(range(self._n)[idx])
+        else:
+            idx = np.asarray(idx)
+            n = int(np.count_nonzero(idx)) if idx.dtype == bool else len(idx)
+        colonne = {}
+        for k, c in self._colonne.items():
+            if isinstance(c, _Categorie):
+                colonne[k] = _Categorie(c.valori, c.codici[idx])
+            else:
+                colonne[k] = c if c.ndim == 0 else c[idx]
+        nuovo = object.__new__(RisultatiScenari)
+        nuovo._n, nuovo._colonne = n, colonne
+        return nuovo
+
+    def __repr__(self):
+        return (f"RisultatiScenari({self._n} righe, {len(self._colonne)} campi, "
+                f"{len(self.condivisi)} condivisi, {self.nbytes:,} byte)")
+
+    # ── Esportazione ──────────────────────────────────────────────────────
+    def a_csv(self, f, intestazione: bool = True):
+        """Scrive le righe su un file di testo aperto; NaN come cella vuota."""
+        w = csv.writer(f)
+        if intestazione:
+            w.writerow(self.campi)
+        for a in range(0, self._n, _BLOCCO_CSV):
+            blocco = self[a:a + _BLOCCO_CSV]
+            valori = []
+            for k, c in blocco._colonne.items():
+                if isinstance(c, _Categorie):
+                    nomi = c.valori.tolist()
+                    valori.append([nomi[j] for j in c.codici.tolist()])
+                    continue
+                lista = (repeat(c.item(), len(blocco)) if c.ndim == 0
+                         else c.tolist())
+                if c.dtype.kind == "f":
+                    lista = ["" if x != x else x for x in lista]
+                valori.append(lista)
+            w.writerows(zip(*valori))
+
+    def salva_npz(self, percorso):
+        """Salva in formato .npz compresso, conservando la forma compatta."""
+        array = {"__campi__": np.array(self.campi), "__righe__": np.array(self._n)}
+        for k, c in self._colonne.items():
+            if isinstance(c, _Categorie):
+                array[k], array[k + ":valori"] = c.codici, c.valori
+            else:
+                array[k] = c
+        np.savez_compressed(percorso, **array)
+
+    @classmethod
+    def carica_npz(cls, percorso) -> "RisultatiScenari":
+        with np.load(percorso, allow_pickle=False) as npz:
+            colonne = {}
+            for k in npz["__campi__"].tolist():
+                if k + ":valori" in npz:
+                    colonne[k] = _Categorie(npz[k + ":valori"], npz[k])
+                else:
+                    colonne[k] = npz[k]
+            return cls(colonne, int(npz["__righe__"]))
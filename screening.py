@@ -0,0 +1,210 @@
+"""
+Screening di sostenibilità: per ogni cliente le offerte mutuo accessibili,
+ordinate per costo totale.
+
+Uso:
+    python screening.py clienti.csv offerte.csv -o idonee.csv
+
+Un'offerta è accessibile se la rata totale non supera `dti_max`% del
+reddito netto mensile e i costi iniziali non superano i risparmi. Rata,
+costi iniziali e costo totale non dipendono dal cliente e non richiedono il
+TAEG: vengono calcolati una volta per tutte le offerte, che poi si ordinano
+per costo totale e si dividono in blocchi con i minimi di rata e costi
+iniziali. Un blocco il cui minimo supera il limite del cliente è saltato
+senza confronti, e la scansione si ferma appena il cliente ha le sue
+`--migliori` offerte. Il TAEG è calcolato solo per le offerte selezionate.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from batch import IMMOBILE_DEFAULT, SCENARIO_DEFAULT, colonne, leggi_csv
+from motore import calcola_righe
+
+CLIENTE_DEFAULT = {
+    "cliente":  "",
+    "reddito":  0.0,   # netto mensile
+    "risparmi": 0.0,
+    "dti_max":  33.0,  # % del reddito destinabile alla rata
+}
+OFFERTA_DEFAULT = {**IMMOBILE_DEFAULT, **SCENARIO_DEFAULT}
+
+_BLOCCO_OFFERTE = 1024  # offerte per blocco (minimi di rata e costi)
+_BLOCCO_CLIENTI = 256   # clienti confrontati insieme con un blocco di offerte
+
+
+# ── Indice offerte ────────────────────────────────────────────────────────────
+class IndiceOfferte:
+    """Offerte ordinate per costo totale, a blocchi con i limiti inferiori."""
+
+    def __init__(self, rata, costi_iniz, costo_totale,
+                 blocco: int = _BLOCCO_OFFERTE):
+        # NaN (dati non validi) in coda e mai accessibili
+        costo_totale = np.where(np.isnan(costo_totale), np.inf, costo_totale)
+        self.ordine = np.argsort(costo_totale, kind="stable")
+        self.rata = np.where(np.isnan(rata), np.inf, rata)[self.ordine]
+        self.costi = np.where(np.isnan(costi_iniz), np.inf, costi_iniz)[self.ordine]
+        self.inizi = np.arange(0, len(self.ordine), blocco)
+        self.fini = np.append(self.inizi[1:], len(self.ordine))
+        self.rata_min = np.minimum.reduceat(self.rata, self.inizi)
+        self.costi_min = np.minimum.reduceat(self.costi, self.inizi)
+
+    def seleziona(self, max_rata, max_costi, migliori: int | None = None):
+        """
+        Offerte accessibili per ogni cliente, dalla più economica.
+        Ritorna (cliente, offerta, posizione) come array paralleli; `offerta`
+        indicizza le righe originali, `posizione` parte da 1.
+        """
+        max_rata = np.asarray(max_rata, dtype=float)
+        max_costi = np.asarray(max_costi, dtype=float)
+        limite = np.iinfo(np.int64).max if migliori is None else migliori
+        trovate = np.zeros(len(max_rata), dtype=np.int64)
+        clienti, offerte, posizioni = [], [], []
+        for b, (a, z) in enumerate(zip(self.inizi, self.fini)):
+            attivi = np.flatnonzero((trovate < limite)
+                                    & (self.rata_min[b] <= max_rata)
+                                    & (self.costi_min[b] <= max_costi))
+            if not attivi.size:
+                if (trovate >= limite).all():
+                    break
+                continue
+            ok = ((self.rata[a:z] <= max_rata[attivi, None])
+                  & (self.costi[a:z] <= max_costi[attivi, None]))
+            riga, col = np.nonzero(ok)  # per cliente, in ordine di costo
+            inizio_riga = np.searchsorted(riga, np.arange(len(attivi)))
+            pos = trovate[attivi][riga] + np.arange(len(riga)) - inizio_riga[riga]
+            tieni = pos < limite
+            clienti.append(attivi[riga[tieni]])
+            offerte.append(self.ordine[a + col[tieni]])
+            posizioni.append(pos[tieni] + 1)
+            trovate[attivi] = np.minimum(trovate[attivi] + ok.sum(axis=1), limite)
+        if not clienti:
+            vuoto = np.zeros(0, dtype=np.int64)
+            return vuoto, vuoto, vuoto
+        clienti = np.concatenate(clienti)
+        offerte = np.concatenate(offerte)
+        posizioni = np.concatenate(posizioni)
+        ordine = np.lexsort((posizioni, clienti))
+        return clienti[ordine], offerte[ordine], posizioni[ordine]
+
+
+# ── Parallelo per clienti ─────────────────────────────────────────────────────
+_indice: IndiceOfferte | None = None
+
+
+def _inizializza(indice: IndiceOfferte):
+    global _indice
+    _indice = indice
+
+
+def _seleziona_blocco(args):
+    inizio, max_rata, max_costi, migliori = args
+    clienti, offerte, posizioni = _indice.seleziona(max_rata, max_costi, migliori)
+    return clienti + inizio, offerte, posizioni
+
+
+def screening(clienti: dict, indice: IndiceOfferte, migliori: int | None = None,
+              pool: ProcessPoolExecutor | None = None):
+    """
+    Selezione per tutti i clienti, a blocchi; con un pool (inizializzato con
+    _inizializza e l'indice) i blocchi di clienti vanno in parallelo.
+    """
+    max_rata = (np.asarray(clienti["reddito"], dtype=float)
+                * np.asarray(clienti["dti_max"], dtype=float) / 100)
+    max_costi = np.asarray(clienti["risparmi"], dtype=float)
+    lavori = [(a, max_rata[a:a + _BLOCCO_CLIENTI],
+               max_costi[a:a + _BLOCCO_CLIENTI], migliori)
+              for a in range(0, len(max_rata), _BLOCCO_CLIENTI)]
+    if pool is None:
+        _inizializza(indice)
+        parti = [_seleziona_blocco(lavoro) for lavoro in lavori]
+    else:
+        parti = list(pool.map(_seleziona_blocco, lavori))
+    if not parti:
+        vuoto = np.zeros(0, dtype=np.int64)
+        return vuoto, vuoto, vuoto
+    return tuple(np.concatenate(p) for p in zip(*parti))
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def main(argv=None):
+    ap = argparse.ArgumentParser(
+        description="Offerte mutuo accessibili per ogni cliente")
+    ap.add_argument("clienti",
+                    help="CSV clienti: cliente, reddito, risparmi, dti_max (%%)")
+    ap.add_argument("offerte",
+                    help="CSV offerte: campi immobile e mutuo come in batch.py")
+    ap.add_argument("-o", "--output", default="idonee.csv",
+                    help="CSV delle offerte accessibili (default: %(default)s)")
+    ap.add_argument("--migliori", type=int, default=10,
+                    help="offerte per cliente, 0 = tutte (default: %(default)s)")
+    ap.add_argument("--processi", type=int, default=os.cpu_count() or 1,
+                    help="processi paralleli (default: %(default)s)")
+    args = ap.parse_args(argv)
+
+    try:
+        clienti = leggi_csv(args.clienti, CLIENTE_DEFAULT, "cliente", "Cliente")
+        offerte = leggi_csv(args.offerte, OFFERTA_DEFAULT, "label", "Offerta")
+    except (OSError, ValueError, csv.Error) as e:
+        ap.error(str(e))
+    if not clienti or not offerte:
+        ap.error("nessuna riga da calcolare")
+
+    inizio = time.perf_counter()
+    col_cli, col_off = colonne(clienti), colonne(offerte)
+    stime = calcola_righe(col_off, taeg=False)
+    rata, costi, costo = stime["rata"], stime["tot_costi_iniz"], stime["costo_totale"]
+    indice = IndiceOfferte(rata, costi, costo)
+    # TAEG calcolato una volta, e solo per le offerte selezionate da qualcuno
+    taeg = np.full(len(offerte), np.nan)
+    noto = np.zeros(len(offerte), dtype=bool)
+
+    pool = (ProcessPoolExecutor(args.processi, initializer=_inizializza,
+                                initargs=(indice,))
+            if args.processi > 1 else None)
+    # Clienti a gruppi: con --migliori 0 le righe possono essere molte
+    gruppo = _BLOCCO_CLIENTI * max(args.processi, 1)
+    righe = 0
+    try:
+        with open(args.output, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(["cliente", "posizione", "offerta", "immobile", "rata",
+                        "dti", "tot_costi_iniz", "costo_totale", "taeg"])
+            for a in range(0, len(clienti), gruppo):
+                parte = {k: v[a:a + gruppo] for k, v in col_cli.items()}
+                cli, off, pos = screening(parte, indice, args.migliori or None, pool)
+                nuove = np.unique(off[~noto[off]])
+                if nuove.size:
+                    taeg[nuove] = calcola_righe(
+                        {k: v[nuove] for k, v in col_off.items()})["taeg"]
+                    noto[nuove] = True
+                reddito = parte["reddito"][cli].astype(float)
+                dti = np.divide(rata[off] * 100, reddito,
+                                out=np.full(len(off), np.nan), where=reddito > 0)
+                w.writerows(
+                    ["" if x != x else x for x in r]
+                    for r in zip(parte["cliente"][cli].tolist(), pos.tolist(),
+                                 col_off["label"][off].tolist(),
+                                 col_off["immobile"][off].tolist(),
+                                 rata[off].tolist(), dti.tolist(),
+                                 costi[off].tolist(), costo[off].tolist(),
+                                 taeg[off].tolist()))
+                righe += len(pos)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    durata = time.perf_counter() - inizio
+
+    coppie = len(clienti) * len(offerte)
+    print(f"{len(clienti)} clienti × {len(offerte)} offerte ({coppie:,} coppie) "
+          f"in {durata:.2f} s: {righe} righe, TAEG calcolato per "
+          f"{int(noto.sum())} offerte → {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+"""
+Verifica differenziale del motore: i percorsi ottimizzati devono dare gli
+stessi numeri dell'implementazione di riferimento.
+
+Uso:
+    python verifica.py --casi 1000000
+
+Genera casi casuali e casi limite (tasso zero, durate non multiple di 12
+mesi, polizze Unica/Annuale/In rata, imposta sostitutiva in € fisso, netto
+erogato ≤ 0 dove calcola_taeg ritorna None, prezzo o durata nulli), li
+calcola con calcola_scenario/calcola_taeg riga per riga e con i percorsi
+vettoriali, su un pool di processi. Riporta lo scostamento massimo assoluto
+e relativo per percorso, le velocità, e riduce i casi che falliscono a un
+riproduttore minimo. Misura infine la velocità di esportazione XLSX/ODS.
+Esce con codice 1 se qualche caso fallisce.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from cache_risultati import CacheRisultati
+from esporta import FORMATI, esporta
+from imposte import REGOLE, TIPI, VENDITORI
+from motore import CAMPI_NUMERICI, _calcola_righe, calcola_righe, calcola_scenario
+
+POL_MODI = ("In rata", "Annuale", "Unica")
+SOST_MODI = ("Prima casa", "Seconda casa", "€ fisso")
+PERCORSI = ("vettoriale", "senza TAEG", "cache fredda", "cache calda")
+SCENARI_ESPORTAZIONE = 500  # scenari con piano nel benchmark di esportazione
+
+# Famiglie di casi limite, ciascuna forzata su una quota delle righe
+CASI_LIMITE = (
+    "tasso zero", "mesi non multipli di 12", "durata frazionaria",
+    "polizza unica", "polizza annuale", "sostitutiva fissa", "netto ≤ 0",
+    "prezzo zero", "durata zero",
+)
+_QUOTA_LIMITE = 0.4
+
+
+# ── Generazione ───────────────────────────────────────────────────────────────
+def _arrotonda(rng, x: np.ndarray, da: int, a: int) -> np.ndarray:
+    """Ogni valore arrotondato a un numero casuale di decimali in [da, a)."""
+    scala = 10.0 ** rng.integers(da, a, len(x))
+    return np.round(x * scala) / scala
+
+
+def genera_casi(n: int, seme) -> dict:
+    """Colonne d'ingresso di calcola_righe per `n` casi, riproducibili dal seme."""
+    rng = np.random.default_rng(seme)
+    c = {
+        "immobile":      np.full(n, "Immobile"),
+        "prezzo":        _arrotonda(rng, rng.uniform(3e4, 2e6, n), -3, 3),
+        "notaio":        rng.uniform(0, 6000, n).round(2),
+        "val_catastale": rng.uniform(0, 5e5, n).round(2),
+        "imposta_tipo":  rng.choice(TIPI, n),
+        "venditore":     rng.choice(VENDITORI, n),
+        "under36":       rng.random(n) < 0.3,
+        "data":          (np.datetime64("2014-01-01")
+                          + rng.integers(0, 14 * 365, n).astype("timedelta64[D]")),
+        "agenzia_mode":  rng.choice(("% Prezzo", "€ Importo"), n),
+        "agenzia":       rng.uniform(0, 6, n).round(2),
+        "agenzia_iva":   rng.choice((0.0, 22.0), n, p=(0.1, 0.9)),
+        "label":         np.full(n, "Caso"),
+        "mutuo_mode":    rng.choice(("€ Importo", "% Prezzo"), n),
+        "importo":       _arrotonda(rng, rng.uniform(1e4, 1.5e6, n), -3, 3),
+        "tasso":         _arrotonda(rng, rng.uniform(0.01, 12, n), 1, 4),
+        "durata":        rng.integers(1, 41, n).astype(float),
+        "pol_si":        rng.uniform(0, 1500, n).round(2),
+        "pol_si_mode":   rng.choice(POL_MODI, n),
+        "pol_v":         rng.uniform(0, 1500, n).round(2),
+        "pol_v_mode":    rng.choice(POL_MODI, n),
+        "istruttoria":   rng.uniform(0, 3000, n).round(2),
+        "perizia":       rng.uniform(0, 800, n).round(2),
+        "imp_sost_mode": rng.choice(SOST_MODI, n),
+        "imp_sost":      rng.uniform(0, 8000, n).round(2),
+    }
+    pct = c["mutuo_mode"] == "% Prezzo"
+    c["importo"][pct] = rng.uniform(1, 100, pct.sum()).round(1)
+
+    famiglia = np.where(rng.random(n) < _QUOTA_LIMITE,
+                        rng.integers(0, len(CASI_LIMITE), n), -1)
+
+    def forza(nome):
+        return famiglia == CASI_LIMITE.index(nome)
+
+    c["tasso"][forza("tasso zero")] = 0.0
+    m = forza("mesi non multipli di 12")
+    c["durata"][m] = rng.choice(np.setdiff1d(np.arange(1, 481), np.arange(0, 481, 12)),
+                                m.sum()) / 12
+    m = forza("durata frazionaria")
+    c["durata"][m] = rng.uniform(0.01, 40, m.sum())
+    c["pol_si_mode"][forza("polizza unica")] = "Unica"
+    c["pol_si_mode"][forza("polizza annuale")] = "Annuale"
+    c["imp_sost_mode"][forza("sostitutiva fissa")] = "€ fisso"
+    m = forza("netto ≤ 0")
+    c["mutuo_mode"][m] = "€ Importo"
+    c["importo"][m] = rng.uniform(0, 2000, m.sum()).round(2)
+    c["istruttoria"][m] = c["importo"][m] + rng.uniform(0, 500, m.sum()).round(2)
+    c["prezzo"][forza("prezzo zero")] = 0.0
+    c["durata"][forza("durata zero")] = 0.0
+    return c
+
+
+def righe_da_colonne(c: dict) -> list[dict]:
+    """Colonne -> dict per riga con tipi Python (date comprese)."""
+    campi = list(c)
+    return [dict(zip(campi, v)) for v in zip(*(np.asarray(c[k]).tolist() for k in campi))]
+
+
+# ── Riferimento scalare ───────────────────────────────────────────────────────
+# Indipendente dal motore vettoriale: provvigione e imposte come le
+# calcolava l'app, regole fiscali cercate scorrendo REGOLE.
+def _agenzia(prezzo: float, valore: float, iva: float, mode: str):
+    """(totale_lordo, imponibile, iva_importo), come il vecchio App._get_agenzia."""
+    if mode == "% Prezzo":
+        imponibile = prezzo * valore / 100
+        iva_imp    = imponibile * iva / 100
+        totale     = imponibile + iva_imp
+    else:  # € Importo già lordo
+        totale     = valore
+        iva_imp    = 0.0
+        imponibile = valore
+    return totale, imponibile, iva_imp
+
+
+def _regola(venditore: str, tipo: str, under36: bool, data) -> dict:
+    """La regola di REGOLE valida alla data; una specifica per under36 prevale."""
+    valide = [r for r in REGOLE
+              if r["venditore"] == venditore and r["tipo"] == tipo
+              and r["under36"] in (None, under36)
+              and r["dal"] <= data and (r["al"] is None or data <= r["al"])]
+    if not valide:
+        raise ValueError(f"Nessuna regola per {venditore}, {tipo}, {data}")
+    return max(valide, key=lambda r: r["under36"] is not None)
+
+
+def _imposte(prezzo: float, val_cat: float, venditore: str, tipo: str,
+             under36: bool, data) -> dict:
+    r = _regola(venditore, tipo, under36, data)
+    if r["registro_fisso"] > 0:
+        registro = r["registro_fisso"]
+    elif r["registro_pct"] > 0:
+        registro = max(round(val_cat * r["registro_pct"], 2), r["registro_min"])
+    else:
+        registro = 0.0
+    iva = round(prezzo * r["iva_pct"], 2)
+    credito = iva * r["credito_iva"]
+    return {
+        "pct":        r["registro_pct"],
+        "registro":   registro,
+        "ipotecaria": r["ipotecaria"],
+        "catastale":  r["catastale"],
+        "iva_pct":    r["iva_pct"],
+        "iva":        iva,
+        "credito":    credito,
+        "totale":     registro + r["ipotecaria"] + r["catastale"] + iva - credito,
+    }
+
+
+# ── Percorsi ──────────────────────────────────────────────────────────────────
+def riferimento(d: dict) -> dict:
+    """Una riga con l'implementazione scalare, come faceva l'app."""
+    agenzia, impon, iva = _agenzia(d["prezzo"], d["agenzia"], d["agenzia_iva"],
+                                   d["agenzia_mode"])
+    imp = _imposte(d["prezzo"], d["val_catastale"], d["venditore"],
+                   d["imposta_tipo"], d["under36"], d["data"])
+    extra = {
+        "agenzia_impon":   impon,
+        "agenzia_iva":     iva,
+        "agenzia_pct":     d["agenzia"] if d["agenzia_mode"] == "% Prezzo" else 0.0,
+        "agenzia_iva_pct": d["agenzia_iva"],
+        "imp_pct":         imp["pct"],
+        "imp_registro":    imp["registro"],
+        "imp_ipotecaria":  imp["ipotecaria"],
+        "imp_catastale":   imp["catastale"],
+        "imp_iva_pct":     imp["iva_pct"],
+        "imp_iva":         imp["iva"],
+        "imp_credito_iva": imp["credito"],
+    }
+    # Anche l'imposta sostitutiva dalla ricerca scalare: a calcola_scenario
+    # arriva già in € fisso
+    p = d
+    if d["imp_sost_mode"] in ("Prima casa", "Seconda casa"):
+        importo = (d["prezzo"] * d["importo"] / 100
+                   if d["mutuo_mode"] == "% Prezzo" else d["importo"])
+        sost = _regola("Privato", d["imp_sost_mode"], d["under36"], d["data"])
+        p = dict(d, imp_sost_mode="€ fisso", imp_sost=importo * sost["sost_pct"])
+    ris = calcola_scenario(p, d["prezzo"], d["notaio"], agenzia, imp["totale"],
+                           extra, d["under36"], d["data"])
+    ris["imp_sost_mode"] = d["imp_sost_mode"]
+    return ris
+
+
+def _matrice(righe: list[dict]) -> np.ndarray:
+    """Campi numerici di dict riga (None -> NaN) come matrice righe × campi."""
+    return np.array([[np.nan if r[k] is None else r[k] for k in CAMPI_NUMERICI]
+                     for r in righe], dtype=float)
+
+
+def _colonne_matrice(ris) -> np.ndarray:
+    return np.column_stack([np.asarray(ris[k], dtype=float) for k in CAMPI_NUMERICI])
+
+
+# ── Confronto ─────────────────────────────────────────────────────────────────
+def scostamenti(ref: np.ndarray, alt: np.ndarray, atol: float, rtol: float):
+    """(assoluto, relativo, fallito) elemento per elemento; NaN solo su entrambi."""
+    nan_ref, nan_alt = np.isnan(ref), np.isnan(alt)
+    with np.errstate(invalid="ignore"):
+        ass = np.where(nan_ref & nan_alt, 0.0, np.abs(ref - alt))
+    ass[nan_ref != nan_alt] = np.inf
+    rel = ass / np.maximum(np.abs(np.nan_to_num(ref)), 1e-300)
+    rel[ass == 0] = 0.0
+    fallito = ass > atol + rtol * np.abs(np.nan_to_num(ref))
+    return ass, rel, fallito
+
+
+def _riassunto(ass, rel, fallito, righe, senza=()):
+    colonne = [j for j, k in enumerate(CAMPI_NUMERICI) if k not in senza]
+    ass, rel, fallito = ass[:, colonne], rel[:, colonne], fallito[:, colonne]
+    campi = [CAMPI_NUMERICI[j] for j in colonne]
+    i_a = np.unravel_index(np.argmax(ass), ass.shape) if ass.size else (0, 0)
+    i_r = np.unravel_index(np.argmax(rel), rel.shape) if rel.size else (0, 0)
+    casi = []
+    for i, j in zip(*np.nonzero(fallito)):
+        if len(casi) >= 3:
+            break
+        casi.append((campi[j], righe[i]))
+    return {
+        "max_ass":  (float(ass[i_a]) if ass.size else 0.0, campi[i_a[1]] if campi else ""),
+        "max_rel":  (float(rel[i_r]) if rel.size else 0.0, campi[i_r[1]] if campi else ""),
+        "falliti":  int(fallito.any(axis=1).sum()),
+        "casi":     casi,
+    }
+
+
+def _verifica_blocco(args) -> dict:
+    """Un blocco di casi su tutti i percorsi (eseguito nei processi del pool)."""
+    seme, indice, n, atol, rtol = args
+    c = genera_casi(n, (seme, indice))
+    righe = righe_da_colonne(c)
+    tempi = {}
+
+    t = time.perf_counter()
+    ref = _matrice([riferimento(d) for d in righe])
+    tempi["riferimento"] = time.perf_counter() - t
+
+    risultati = {}
+    t = time.perf_counter()
+    risultati["vettoriale"] = _colonne_matrice(calcola_righe(c))
+    tempi["vettoriale"] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    risultati["senza TAEG"] = _colonne_matrice(calcola_righe(c, taeg=False))
+    tempi["senza TAEG"] = time.perf_counter() - t
+
+    with tempfile.TemporaryDirectory() as cartella:
+        with CacheRisultati(Path(cartella) / "verifica.sqlite") as cache:
+            for percorso in ("cache fredda", "cache calda"):
+                t = time.perf_counter()
+                risultati[percorso] = _colonne_matrice(calcola_righe(c, cache))
+                tempi[percorso] = time.perf_counter() - t
+
+    riassunti = {}
+    for percorso, alt in risultati.items():
+        senza = ("taeg",) if percorso == "senza TAEG" else ()
+        riassunti[percorso] = _riassunto(*scostamenti(ref, alt, atol, rtol),
+                                         righe, senza)
+    return {"righe": n, "tempi": tempi, "percorsi": riassunti}
+
+
+# ── Riduzione dei casi falliti ────────────────────────────────────────────────
+def _calcola_percorso(d: dict, percorso: str, cache: CacheRisultati) -> np.ndarray:
+    """Un caso lungo `percorso`, come matrice 1 × campi numerici."""
+    c = {k: np.array([v]) for k, v in d.items()}
+    if percorso.startswith("cache"):
+        alt = _colonne_matrice(calcola_righe(c, cache))  # chiave nuova: fredda
+        if percorso == "cache calda":
+            alt = _colonne_matrice(calcola_righe(c, cache))
+        return alt
+    return _colonne_matrice(_calcola_righe(c, taeg=percorso != "senza TAEG"))
+
+
+def _fallisce(d: dict, campo: str, percorso: str, atol: float, rtol: float,
+              cache: CacheRisultati) -> bool:
+    try:
+        ref = _matrice([riferimento(d)])
+        alt = _calcola_percorso(d, percorso, cache)
+    except Exception:
+        return False  # un caso che non gira più non è un riproduttore
+    _, _, fallito = scostamenti(ref, alt, atol, rtol)
+    return bool(fallito[0, CAMPI_NUMERICI.index(campo)])
+
+
+def _semplificazioni(k: str, v):
+    """Valori più semplici di `v`; ogni passo si avvicina a un punto fisso."""
+    if isinstance(v, bool):
+        return [False] if v else []
+    if isinstance(v, float):
+        if v in (0.0, 1.0):
+            return []
+        return list(dict.fromkeys(
+            x for x in (0.0, 1.0, float(round(v, -3)), float(round(v)), round(v, 2))
+            if x != v))
+    if isinstance(v, str):
+        scelte = {"imposta_tipo": TIPI, "venditore": VENDITORI,
+                  "agenzia_mode": ("% Prezzo",), "mutuo_mode": ("€ Importo",),
+                  "pol_si_mode": POL_MODI, "pol_v_mode": POL_MODI,
+                  "imp_sost_mode": SOST_MODI}.get(k, ())
+        return [scelte[0]] if scelte and v != scelte[0] else []
+    return []
+
+
+def riduci(d: dict, campo: str, percorso: str, atol: float, rtol: float) -> dict:
+    """Semplifica un caso fallito un campo alla volta finché continua a fallire."""
+    d = dict(d)
+    with tempfile.TemporaryDirectory() as cartella:
+        with CacheRisultati(Path(cartella) / "riduci.sqlite") as cache:
+            cambiato = True
+            while cambiato:
+                cambiato = False
+                for k in list(d):
+                    for v in _semplificazioni(k, d[k]):
+                        prova = dict(d, **{k: v})
+                        if _fallisce(prova, campo, percorso, atol, rtol, cache):
+                            d, cambiato = prova, True
+                            break
+    return d
+
+
+# ── Esportazione ──────────────────────────────────────────────────────────────
+def misura_esportazione(n: int, seme) -> list[tuple]:
+    """(formato, righe, secondi, byte) esportando n scenari con i piani."""
+    ris = calcola_righe(genera_casi(n, seme))
+    misure = []
+    with tempfile.TemporaryDirectory() as cartella:
+        for formato in FORMATI:
+            percorso = Path(cartella) / f"verifica{formato}"
+            t = time.perf_counter()
+            righe = esporta(percorso, ris, piani=True)
+            misure.append((formato, righe, time.perf_counter() - t,
+                           percorso.stat().st_size))
+    return misure
+
+
+# ── Main ──────────────────────────────────────────────────────────────────────
+def _fmt_tempo(s: float) -> str:
+    return f"{s:8.2f} s" if s >= 1 else f"{s * 1e3:7.1f} ms"
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(
+        description="Verifica differenziale e velocità del motore di calcolo")
+    ap.add_argument("--casi", type=int, default=20_000,
+                    help="numero di casi (default: %(default)s)")
+    ap.add_argument("--blocco", type=int, default=5_000,
+                    help="casi per lavoro nel pool (default: %(default)s)")
+    ap.add_argument("--processi", type=int, default=os.cpu_count() or 1,
+                    help="processi paralleli (default: %(default)s)")
+    ap.add_argument("--seme", type=int, default=0)
+    ap.add_argument("--atol", type=float, default=1e-6,
+                    help="tolleranza assoluta (default: %(default)s)")
+    ap.add_argument("--rtol", type=float, default=1e-9,
+                    help="tolleranza relativa (default: %(default)s)")
+    args = ap.parse_args(argv)
+
+    lavori = [(args.seme, i, min(args.blocco, args.casi - a), args.atol, args.rtol)
+              for i, a in enumerate(range(0, args.casi, args.blocco))]
+    inizio = time.perf_counter()
+    if args.processi > 1:
+        with ProcessPoolExecutor(args.processi) as pool:
+            esiti = list(pool.map(_verifica_blocco, lavori))
+    else:
+        esiti = [_verifica_blocco(lavoro) for lavoro in lavori]
+    durata = time.perf_counter() - inizio
+
+    righe = sum(e["righe"] for e in esiti)
+    tempi = {k: sum(e["tempi"][k] for e in esiti) for k in esiti[0]["tempi"]}
+    print(f"{righe:,} casi ({_QUOTA_LIMITE:.0%} casi limite) in {durata:.1f} s"
+          f" con {args.processi} processi; tolleranza {args.atol:g} + {args.rtol:g}·|rif|")
+    print()
+    print(f"{'percorso':<14}{'tempo CPU':>12}{'righe/s':>14}{'speedup':>10}"
+          f"{'max scost. ass.':>30}{'max scost. rel.':>30}{'falliti':>9}")
+    print(f"{'riferimento':<14}{_fmt_tempo(tempi['riferimento']):>12}"
+          f"{righe / tempi['riferimento']:>14,.0f}{1:>9.1f}×")
+    falliti = []
+    for percorso in PERCORSI:
+        p = [e["percorsi"][percorso] for e in esiti]
+        ass = max((x["max_ass"] for x in p), key=lambda x: x[0])
+        rel = max((x["max_rel"] for x in p), key=lambda x: x[0])
+        n_falliti = sum(x["falliti"] for x in p)
+        print(f"{percorso:<14}{_fmt_tempo(tempi[percorso]):>12}"
+              f"{righe / tempi[percorso]:>14,.0f}"
+              f"{tempi['riferimento'] / tempi[percorso]:>9.1f}×"
+              f"{f'{ass[0]:.3g} ({ass[1]})':>30}{f'{rel[0]:.3g} ({rel[1]})':>30}"
+              f"{n_falliti:>9}")
+        falliti += [(percorso, campo, d) for x in p for campo, d in x["casi"]]
+
+    print()
+    n = min(SCENARI_ESPORTAZIONE, args.casi)
+    print(f"Esportazione di {n} scenari con i piani di ammortamento:")
+    for formato, righe_foglio, secondi, byte in misura_esportazione(n, args.seme):
+        print(f"  {formato:<6}{righe_foglio:>10,} righe{_fmt_tempo(secondi):>12}"
+              f"{righe_foglio / secondi:>12,.0f} righe/s{byte / 2**20:>8.1f} MB")
+
+    if falliti:
+        print()
+        print("Riproduttori minimi:")
+        visti = set()
+        for percorso, campo, d in falliti:
+            if percorso in visti:  # un riproduttore per percorso
+                continue
+            visti.add(percorso)
+            minimo = riduci(d, campo, percorso, args.atol, args.rtol)
+            ref = riferimento(minimo)[campo]
+            # Stesso percorso del caso fallito, cache compresa (nuova)
+            with tempfile.TemporaryDirectory() as cartella:
+                with CacheRisultati(Path(cartella) / "riproduci.sqlite") as cache:
+                    alt = _calcola_percorso(minimo, percorso, cache)
+            alt = float(alt[0, CAMPI_NUMERICI.index(campo)])
+            print(f"  [{percorso}] {campo}: riferimento {ref!r}, ottenuto {alt!r}")
+            print(f"    {minimo!r}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()